@@ -0,0 +1,372 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import PIL
+from bmp_io import BmpWriter
+from merge import QUADRANTS
+
+DEFAULT_SIZES = (1024, 4096)
+DEFAULT_TOLERANCE = 0.15
+STARTUP_BUDGET = 1.0  # 窗口可用的目标时间（秒）
+RED_PREFIX = "A_bench"
+GREEN_PREFIX = "C_bench"
+STRIP_ROWS = 256
+
+def make_quadrant(path, size, seed):
+    """
+    写出一张 size x size 的合成 24 位灰度 BMP
+
+    亮背景上散布暗点（类似扫描得到的荧光点反相后的样子），按行条生成，
+    8k 图片也只占用几个行条的内存
+    """
+    rng = np.random.default_rng(seed)
+    with BmpWriter(path, size, size) as writer:
+        for start in range(0, size, STRIP_ROWS):
+            rows = min(STRIP_ROWS, size - start)
+            gray = rng.normal(200, 12, (rows, size))
+            spots = rng.random((rows, size)) < 0.002
+            gray[spots] = rng.integers(0, 120, spots.sum())
+            gray = np.clip(gray, 0, 255).astype(np.uint8)
+            writer.write_rows(np.repeat(gray[..., None], 3, axis=2))
+
+def make_dataset(data_folder, size):
+    """
+    生成一个尺寸的基准数据集（已存在时直接复用）
+
+    目录结构:
+    raw/       两组 _LD/_LU/_RD/_RU 原始图片
+    combined/  合并图与伪彩图，供各阶段作为输入
+    red/ green/  batch_overlay 使用的伪彩图文件夹
+    """
+    from merge import process_image_set
+    from pseudo_color import convert_to_pseudo_color
+
+    folder = os.path.join(data_folder, str(size))
+    raw = os.path.join(folder, "raw")
+    done_marker = os.path.join(folder, ".complete")
+    if os.path.exists(done_marker):
+        return folder
+
+    os.makedirs(raw, exist_ok=True)
+    for index, prefix in enumerate((RED_PREFIX, GREEN_PREFIX)):
+        for q_index, quadrant in enumerate(QUADRANTS):
+            make_quadrant(os.path.join(raw, f"{prefix}_{quadrant}.bmp"), size,
+                          seed=index * 10 + q_index)
+        process_image_set(prefix, raw)
+
+    combined = os.path.join(folder, "combined")
+    shutil.rmtree(combined, ignore_errors=True)
+    shutil.move(os.path.join(raw, "combined"), combined)
+    for sub in ("red", "green"):
+        os.makedirs(os.path.join(folder, sub), exist_ok=True)
+    for prefix, mode in ((RED_PREFIX, 'red'), (GREEN_PREFIX, 'green')):
+        source = os.path.join(combined, f"{prefix}_combined.bmp")
+        pseudo_path = convert_to_pseudo_color(source, mode)
+        shutil.copy(pseudo_path, os.path.join(folder, mode, f"bench_{mode}.bmp"))
+
+    open(done_marker, 'w').close()
+    return folder
+
+# 各阶段：参数为数据集文件夹，输出写到 folder/out 下
+
+def stage_merge(folder):
+    from merge import process_image_set
+    if not process_image_set(RED_PREFIX, os.path.join(folder, "raw")):
+        raise RuntimeError("process_image_set 失败")
+
+def stage_merge_registered(folder):
+    from merge import process_image_set
+    from registration import REGISTRATION_NAME
+    raw = os.path.join(folder, "raw")
+    # 删掉上次的缓存，耗时包括位置估计和接缝羽化拼接
+    cache = os.path.join(raw, "combined", REGISTRATION_NAME)
+    if os.path.exists(cache):
+        os.remove(cache)
+    if not process_image_set(RED_PREFIX, raw, register=True):
+        raise RuntimeError("process_image_set(register=True) 失败")
+
+def stage_pseudo(folder):
+    from pseudo_color import convert_to_pseudo_color
+    source = os.path.join(folder, "combined", f"{RED_PREFIX}_combined.bmp")
+    if convert_to_pseudo_color(source, 'red', os.path.join(folder, "out")) is None:
+        raise RuntimeError("convert_to_pseudo_color 失败")
+
+def stage_overlay(folder):
+    from overlay import overlay_images
+    combined = os.path.join(folder, "combined")
+    if overlay_images(os.path.join(combined, f"{RED_PREFIX}_combined_red.bmp"),
+                      os.path.join(combined, f"{GREEN_PREFIX}_combined_green.bmp"),
+                      os.path.join(folder, "out")) is None:
+        raise RuntimeError("overlay_images 失败")
+
+def stage_batch_overlay(folder):
+    from overlay import batch_overlay
+    if not batch_overlay(os.path.join(folder, "red"), os.path.join(folder, "green"),
+                         os.path.join(folder, "out")):
+        raise RuntimeError("batch_overlay 失败")
+
+def stage_preview(folder):
+    """与 GUI 选择两张合并图后的一次预览刷新相同的步骤（代理层级、冷缓存）"""
+    from PIL import Image
+    from gui import make_thumbnail
+    from overlay import overlay_pairs, pair_data
+    from proxy import ProxyCache
+    from pseudo_color import pseudo_color_image
+
+    proxy_cache = ProxyCache((600, 600))
+    combined = os.path.join(folder, "combined")
+    red_plane = proxy_cache.get(os.path.join(combined, f"{RED_PREFIX}_combined.bmp"))
+    make_thumbnail(pseudo_color_image(red_plane, 'red'), (300, 300))
+    green_plane = proxy_cache.get(os.path.join(combined, f"{GREEN_PREFIX}_combined.bmp"))
+    make_thumbnail(pseudo_color_image(green_plane, 'green'), (300, 300))
+    merged = Image.fromarray(overlay_pairs(*pair_data(red_plane, green_plane)), 'RGBA')
+    make_thumbnail(merged, (600, 600))
+
+STAGES = {
+    'merge': stage_merge,
+    'merge_registered': stage_merge_registered,
+    'pseudo': stage_pseudo,
+    'overlay': stage_overlay,
+    'batch_overlay': stage_batch_overlay,
+    'preview': stage_preview,
+}
+
+def _proc_memory(field):
+    """读取 /proc/self/status 中的内存字段（字节），非 Linux 平台返回 None"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def _measure(stage, folder):
+    """
+    在子进程中执行一个阶段，返回 (耗时秒数, 峰值内存字节数)
+
+    峰值内存为执行期间常驻内存峰值 (VmHWM) 超出执行前常驻内存的部分，执行前
+    先重置峰值记录；没有 /proc 的平台改用 tracemalloc，只统计 Python 和
+    numpy 的分配
+    """
+    import gc
+    # 先导入各阶段用到的模块，导入开销不计入
+    import gui, merge, overlay, proxy, pseudo_color  # noqa: F401
+    out = os.path.join(folder, "out")
+    shutil.rmtree(out, ignore_errors=True)
+    os.makedirs(out)
+    gc.collect()
+
+    baseline = _proc_memory('VmRSS')
+    if baseline is None:
+        tracemalloc.start()
+    else:
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')  # 把 VmHWM 重置为当前值
+        except OSError:
+            pass
+    start = time.perf_counter()
+    STAGES[stage](folder)
+    elapsed = time.perf_counter() - start
+    if baseline is None:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        peak = _proc_memory('VmHWM') - baseline
+    return elapsed, max(peak, 0)
+
+def run_stage(stage, folder, repeat=3):
+    """
+    重复执行一个阶段，每次使用新的进程（缓存为冷状态，峰值内存互不影响）
+
+    返回:
+    dict: 最短耗时、各次耗时和峰值内存（MB）
+    """
+    runs = []
+    peaks = []
+    context = multiprocessing.get_context('spawn')
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            elapsed, peak = pool.submit(_measure, stage, folder).result()
+        runs.append(round(elapsed, 4))
+        peaks.append(peak)
+    return {"seconds": min(runs), "runs": runs,
+            "peak_mb": round(min(peaks) / 1048576, 1)}
+
+def run_benchmarks(data_folder, sizes=DEFAULT_SIZES, stages=tuple(STAGES), repeat=3):
+    """
+    生成数据集并测量各阶段
+
+    返回:
+    dict: {"meta": 运行环境, "results": {尺寸: {阶段: 测量结果}}}
+    """
+    results = {}
+    for size in sizes:
+        print(f"准备 {size}x{size} 数据集...")
+        folder = make_dataset(data_folder, size)
+        results[str(size)] = {}
+        for stage in stages:
+            result = run_stage(stage, folder, repeat)
+            results[str(size)][stage] = result
+            print(f"  {stage:<16} {result['seconds']:8.3f}s  峰值 {result['peak_mb']:8.1f}MB")
+        shutil.rmtree(os.path.join(folder, "out"), ignore_errors=True)
+    return {"meta": run_meta(repeat), "results": results}
+
+def run_meta(repeat):
+    """运行环境信息，与结果一起保存"""
+    return {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": repeat,
+    }
+
+def measure_startup(command, repeat=5, timeout=60):
+    """
+    测量 GUI 从启动进程到窗口可用的时间
+
+    通过环境变量 gui.STARTUP_ENV 让 GUI 在窗口显示并处理完首批事件后写入当时的
+    时间并退出，脚本运行和打包后的程序都适用（打包程序没有控制台输出）
+
+    参数:
+    command: 启动命令，如 [sys.executable, "gui.py"] 或打包后的程序路径
+    repeat: 重复次数，第一次通常为冷启动（文件不在系统缓存中）
+
+    返回:
+    dict: 最短耗时、各次耗时（秒）和第一次的耗时
+    """
+    from gui import STARTUP_ENV
+    marker = os.path.join(tempfile.gettempdir(), f"image_startup_{os.getpid()}.txt")
+    env = dict(os.environ, **{STARTUP_ENV: marker})
+    runs = []
+    for _ in range(repeat):
+        if os.path.exists(marker):
+            os.remove(marker)
+        start = time.time()
+        subprocess.run(command, env=env, timeout=timeout, check=True)
+        with open(marker) as f:
+            runs.append(round(float(f.read()) - start, 4))
+    os.remove(marker)
+    return {"seconds": min(runs), "runs": runs, "first": runs[0]}
+
+def run_startup(frozen=None, repeat=5):
+    """
+    测量脚本运行（以及给出路径时打包程序）的启动时间
+
+    返回:
+    dict: {"script": 测量结果, "frozen": 测量结果}
+    """
+    gui_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gui.py")
+    commands = {"script": [sys.executable, gui_path]}
+    if frozen:
+        commands["frozen"] = [frozen]
+    results = {}
+    for name, command in commands.items():
+        result = measure_startup(command, repeat)
+        results[name] = result
+        print(f"  启动 {name:<8} {result['seconds']:8.3f}s  首次 {result['first']:8.3f}s")
+    return results
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    与基线比较，耗时或峰值内存超过基线 (1 + tolerance) 倍的记为退化
+
+    返回:
+    list: [(尺寸, 阶段, 指标, 基线值, 当前值)]
+    """
+    regressions = []
+    for size, stages in current["results"].items():
+        for stage, result in stages.items():
+            old = baseline.get("results", {}).get(size, {}).get(stage)
+            if old is None:
+                continue
+            for metric in ("seconds", "peak_mb"):
+                if metric not in result or metric not in old:
+                    continue  # 启动时间没有内存指标
+                if result[metric] > old[metric] * (1 + tolerance):
+                    regressions.append((size, stage, metric, old[metric], result[metric]))
+    return regressions
+
+def print_comparison(current, baseline):
+    """打印与基线的对比表"""
+    print(f"{'尺寸':>6} {'阶段':<16} {'基线(s)':>9} {'当前(s)':>9} {'变化':>8}"
+          f" {'基线(MB)':>9} {'当前(MB)':>9}")
+    for size, stages in current["results"].items():
+        for stage, result in stages.items():
+            old = baseline.get("results", {}).get(size, {}).get(stage)
+            if old is None:
+                continue
+            change = result["seconds"] / old["seconds"] - 1 if old["seconds"] else 0.0
+            memory = (f" {old['peak_mb']:9.1f} {result['peak_mb']:9.1f}"
+                      if "peak_mb" in result and "peak_mb" in old else "")
+            print(f"{size:>6} {stage:<16} {old['seconds']:9.3f} {result['seconds']:9.3f}"
+                  f" {change:+8.1%}{memory}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="各处理阶段的性能基准测试")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="每张象限图片的边长，逗号分隔，如 1024,4096,8192")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"要测量的阶段，逗号分隔：{','.join(STAGES)}")
+    parser.add_argument("--repeat", type=int, default=3, help="每个阶段的重复次数")
+    parser.add_argument("--data", default=os.path.join(tempfile.gettempdir(), "image_benchmark"),
+                        help="合成数据集的存放目录（可复用）")
+    parser.add_argument("--output", default="benchmark_results.json", help="结果 JSON 文件")
+    parser.add_argument("--baseline", default=None, help="基线结果 JSON，给出时检查退化")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="允许的退化比例，默认 0.15")
+    parser.add_argument("--startup", action="store_true",
+                        help="只测量GUI启动时间（需要图形界面环境）")
+    parser.add_argument("--frozen", default=None,
+                        help="同时测量打包后的程序，如 dist/图片处理工具/图片处理工具.exe")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET,
+                        help="启动时间预算（秒），超出时返回非零，默认 1.0")
+    args = parser.parse_args(argv)
+
+    over = []
+    if args.startup or args.frozen:
+        # 启动时间作为 "startup" 一组结果保存，可与基线比较
+        startup = run_startup(args.frozen, args.repeat)
+        current = {"meta": run_meta(args.repeat), "results": {"startup": startup}}
+        over = [name for name, result in startup.items() if result["seconds"] > args.budget]
+        for name in over:
+            print(f"超出启动预算: {name} {startup[name]['seconds']:.3f}s > {args.budget}s")
+    else:
+        sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+        stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+        unknown = [s for s in stages if s not in STAGES]
+        if unknown:
+            parser.error(f"未知的阶段: {', '.join(unknown)}")
+        current = run_benchmarks(args.data, sizes, stages, args.repeat)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(current, f, ensure_ascii=False, indent=1)
+    print(f"结果已保存到: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print_comparison(current, baseline)
+        regressions = compare(current, baseline, args.tolerance)
+        for size, stage, metric, old, new in regressions:
+            print(f"退化: {size} {stage} {metric} {old} -> {new}")
+        if regressions:
+            return 1
+    return 1 if over else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+import os
+import struct
+import threading
+import numpy as np
+from PIL import Image
+
+BI_RGB = 0
+BI_BITFIELDS = 3
+BI_ALPHABITFIELDS = 6
+
+# PIL 保存 BMP 时默认 96 dpi，对应的每米像素数
+DEFAULT_PPM = 3780
+
+# RGB 转 L 的定点系数，与 PIL 的 convert('L') 一致
+L_WEIGHTS = (19595, 38470, 7471)
+
+class UnsupportedBmp(ValueError):
+    """BMP 格式不在直接读写支持范围内（压缩、16位等），应回退到 PIL"""
+
+class BmpReader:
+    """
+    未压缩 BMP 的读取器，通过内存映射直接访问像素，不解码整幅图片
+
+    支持 8 位调色板、24 位和 32 位（BI_RGB 或标准 BGRA 位域）格式，
+    自动处理自下而上/自上而下的行顺序和每行4字节对齐的填充。
+    pixels/channel 返回的是映射文件上的跨步视图，不复制数据；
+    read_rows 的行号按文件中自下而上的顺序计数：第0行是图片最底部一行。
+
+    注意：视图存在期间文件保持打开，Windows 下无法覆盖该文件，
+    需要长期保存的数据应自行复制。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(14 + 124)
+        if len(header) < 54 or header[:2] != b'BM':
+            raise UnsupportedBmp(f"不是BMP文件: {path}")
+
+        self.offset = struct.unpack_from('<I', header, 10)[0]
+        dib_size = struct.unpack_from('<I', header, 14)[0]
+        if dib_size < 40:
+            raise UnsupportedBmp(f"不支持的BMP头: {path}")
+        width, height, _, bpp, compression = struct.unpack_from('<iiHHI', header, 18)
+        colors_used = struct.unpack_from('<I', header, 46)[0]
+
+        self.width = width
+        self.height = abs(height)
+        self.top_down = height < 0
+        self.bpp = bpp
+        self.stride = (width * bpp + 31) // 32 * 4
+        self.palette = None
+
+        if bpp == 8 and compression == BI_RGB:
+            count = colors_used or 256
+            with open(path, 'rb') as f:
+                f.seek(14 + dib_size)
+                raw = f.read(count * 4)
+            table = np.zeros((256, 3), dtype=np.uint8)
+            table[:len(raw) // 4] = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 4)[:, :3]
+            self.palette = table  # BGR
+        elif bpp == 24 and compression == BI_RGB:
+            pass
+        elif bpp == 32 and compression == BI_RGB:
+            pass
+        elif bpp == 32 and compression in (BI_BITFIELDS, BI_ALPHABITFIELDS):
+            masks = struct.unpack_from('<III', header, 54)
+            if masks != (0xff0000, 0xff00, 0xff):
+                raise UnsupportedBmp(f"不支持的位域掩码: {path}")
+        else:
+            raise UnsupportedBmp(f"不支持的BMP格式 ({bpp}位, 压缩方式{compression}): {path}")
+
+        if os.path.getsize(path) < self.offset + self.stride * self.height:
+            raise UnsupportedBmp(f"BMP文件不完整: {path}")
+        self._rows = None
+
+    @property
+    def rows(self):
+        """映射后的 (高, stride) 原始行，按文件顺序，首次访问时映射文件"""
+        if self._rows is None:
+            data = np.memmap(self.path, dtype=np.uint8, mode='r',
+                             offset=self.offset, shape=(self.height * self.stride,))
+            self._rows = data.reshape(self.height, self.stride)
+        return self._rows
+
+    def pixels(self):
+        """
+        按从上到下的显示顺序返回像素视图（不复制）
+
+        返回:
+        8 位为 (高, 宽) 的调色板索引，24/32 位为 (高, 宽, 3或4) 的 BGR(A)
+        """
+        rows = self.rows if self.top_down else self.rows[::-1]
+        if self.bpp == 8:
+            return rows[:, :self.width]
+        channels = self.bpp // 8
+        return rows[:, :self.width * channels].reshape(self.height, self.width, channels)
+
+    @property
+    def is_gray(self):
+        """8 位灰度调色板（索引即灰度值）"""
+        return self.palette is not None and np.array_equal(
+            self.palette, np.repeat(np.arange(256, dtype=np.uint8)[:, None], 3, axis=1))
+
+    def channel(self, band):
+        """
+        返回单个通道平面，0 为红色、1 为绿色、2 为蓝色
+
+        24/32 位和灰度调色板为零拷贝视图，其他调色板需查表生成
+        """
+        pixels = self.pixels()
+        if self.bpp != 8:
+            return pixels[..., 2 - band]
+        if self.is_gray:
+            return pixels
+        return self.palette[:, 2 - band][pixels]
+
+    def gray(self):
+        """按 PIL convert('L') 的方式返回灰度平面，灰度调色板时为零拷贝视图"""
+        if self.is_gray:
+            return self.pixels()
+        return rgb_to_gray(self.channel(0), self.channel(1), self.channel(2))
+
+    def gray_region(self, x, y, width, height):
+        """
+        按 convert('L') 的方式读取一块区域的灰度（从上到下的显示坐标），
+        只访问该区域所在的行，不处理整幅图片
+
+        返回:
+        (高, 宽) 的 uint8 数组（副本），超出图片的部分被裁掉
+        """
+        pixels = self.pixels()[max(y, 0):y + height, max(x, 0):x + width]
+        if self.bpp == 8:
+            if self.is_gray:
+                return np.array(pixels)
+            pixels = self.palette[pixels]
+        return rgb_to_gray(pixels[..., 2], pixels[..., 1], pixels[..., 0])
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def _to_bgr(self, rows):
+        """把 (行数, stride) 的原始字节转换为 (行数, 宽, 3) 的 BGR 数组"""
+        width = self.width
+        if self.bpp == 8:
+            return self.palette[rows[:, :width]]
+        channels = self.bpp // 8
+        pixels = rows[:, :width * channels].reshape(len(rows), width, channels)
+        return pixels[..., :3]
+
+    def read_rows(self, start, count):
+        """
+        读取自下而上第 start 行起的 count 行
+
+        返回:
+        (count, 宽, 3) 的 BGR uint8 数组，行顺序同样自下而上
+        """
+        count = max(0, min(count, self.height - start))
+        if self.top_down:
+            first = self.height - start - count
+        else:
+            first = start
+        rows = self.rows[first:first + count]
+        if self.top_down:
+            rows = rows[::-1]
+        return self._to_bgr(rows)
+
+def rgb_to_gray(r, g, b):
+    """按 PIL convert('L') 的定点公式计算灰度"""
+    wr, wg, wb = L_WEIGHTS
+    return ((np.asarray(r, dtype=np.uint32) * wr + np.asarray(g, dtype=np.uint32) * wg
+             + np.asarray(b, dtype=np.uint32) * wb + 0x8000) >> 16).astype(np.uint8)
+
+def open_bmp(path):
+    """路径是可直接映射的BMP时返回 BmpReader，否则返回 None"""
+    if not isinstance(path, (str, os.PathLike)) or not str(path).lower().endswith('.bmp'):
+        return None
+    try:
+        return BmpReader(path)
+    except UnsupportedBmp:
+        return None
+
+def temp_path(path):
+    """
+    path 同目录下的临时文件名，写完后用 os.replace 换成 path
+
+    读取方（GUI、文件夹监视、下游分析）因此不会看到写了一半的文件；
+    名称包含进程号和线程号，并行写入时互不冲突
+    """
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def bmp_file_complete(path):
+    """
+    判断 BMP 文件是否已完整写入：文件长度达到文件头中声明的大小
+
+    用于监视正在被其他程序写入的文件夹；无法读取文件头时返回 False
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(14)
+        if len(header) < 14 or header[:2] != b'BM':
+            return False
+        declared = struct.unpack_from('<I', header, 2)[0]
+        return os.path.getsize(path) >= declared
+    except OSError:
+        return False
+
+def read_gray(image):
+    """
+    读取灰度平面
+
+    参数:
+    image: 图片路径或 PIL Image 对象
+
+    返回:
+    uint8 二维数组；未压缩BMP直接从映射文件计算，其余格式经 PIL 解码
+    """
+    reader = open_bmp(image)
+    if reader is not None:
+        return reader.gray()
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    return np.asarray(image.convert('L'))
+
+def read_channel(image, band):
+    """
+    读取单个通道平面
+
+    参数:
+    image: 图片路径或 PIL Image 对象
+    band: 通道序号，0 为红色，1 为绿色，2 为蓝色
+
+    返回:
+    uint8 二维数组；未压缩BMP为零拷贝视图，其余格式经 PIL 解码
+    """
+    reader = open_bmp(image)
+    if reader is not None:
+        return reader.channel(band)
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    if image.mode == 'L':
+        return np.asarray(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB')
+    return np.asarray(image.getchannel(band))
+
+class BmpWriter:
+    """
+    24 位或 32 位 BMP 的逐行写入器
+
+    先写文件头，再按自下而上的顺序分段写入像素行，文件格式与 PIL 保存的
+    RGB（24位）或 RGBA（32位）图片一致。数据先写入临时文件，全部行写完后
+    才替换为 path
+    """
+
+    def __init__(self, path, width, height, bpp=24):
+        if bpp not in (24, 32):
+            raise ValueError(f"不支持的位数: {bpp}")
+        self.path = path
+        self.width = width
+        self.height = height
+        self.channels = bpp // 8
+        self.stride = (width * bpp + 31) // 32 * 4
+        self.rows_written = 0
+        image_size = self.stride * height
+        self._tmp_path = temp_path(path)
+        self._file = open(self._tmp_path, 'wb')
+        self._file.write(struct.pack('<2sIHHI', b'BM', 54 + image_size, 0, 0, 54))
+        self._file.write(struct.pack('<IiiHHIIiiII', 40, width, height, 1, bpp, BI_RGB,
+                                     image_size, DEFAULT_PPM, DEFAULT_PPM, 0, 0))
+
+    def write_rows(self, rows):
+        """写入 (行数, 宽, 3或4) 的 BGR(A) 数组，行顺序自下而上"""
+        count = len(rows)
+        if self.rows_written + count > self.height:
+            raise ValueError("写入的行数超过图片高度")
+        padded = np.zeros((count, self.stride), dtype=np.uint8)
+        padded[:, :self.width * self.channels] = rows.reshape(count, -1)
+        self._file.write(padded.tobytes())
+        self.rows_written += count
+
+    def close(self):
+        self._file.close()
+        if self.rows_written != self.height:
+            os.remove(self._tmp_path)
+            raise ValueError(f"BMP行数不完整: {self.rows_written}/{self.height}")
+        os.replace(self._tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._file.close()
+            os.remove(self._tmp_path)
+            return False
+        self.close()
+        return False
@@ -0,0 +1,112 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+from instrument import add
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+def _sizeof(value):
+    """估算缓存值占用的字节数"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, Image.Image):
+        return value.width * value.height * len(value.getbands())
+    if isinstance(value, (tuple, list)):
+        return sum(_sizeof(v) for v in value)
+    return 0
+
+def _freeze(value):
+    """缓存的数组设为只读，防止调用方原地修改后污染缓存"""
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, (tuple, list)):
+        for v in value:
+            _freeze(v)
+    return value
+
+class ChannelCache:
+    """
+    按字节预算淘汰的 LRU 缓存，存放解码后的灰度平面、叠加用的通道组合索引和
+    预览代理图
+
+    键由 (类型, 各源文件的绝对路径与修改时间, 处理参数) 组成，文件被改写后
+    自动失效。多个线程可同时使用。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(kind, paths, params=()):
+        """生成缓存键；源文件的修改时间包含在键中"""
+        sources = tuple((os.path.abspath(p), os.stat(p).st_mtime_ns) for p in paths)
+        return (kind, sources, params)
+
+    def get(self, key):
+        """命中时返回缓存值并移到最近使用端，未命中返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                add(cache_misses=1)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            add(cache_hits=1)
+            return entry[0]
+
+    def put(self, key, value):
+        """放入缓存，超出预算时淘汰最久未使用的项；单项超过预算时不缓存"""
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return value
+        _freeze(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted
+        return value
+
+    def get_or_create(self, kind, paths, params, factory):
+        """
+        取缓存值，未命中时调用 factory() 生成并缓存
+
+        参数:
+        kind: 缓存类型，如 'gray'、'proxy'、'pairs'
+        paths: 结果所依赖的源文件路径
+        params: 影响结果的处理参数（需可哈希）
+        factory: 无参函数，返回要缓存的值
+        """
+        key = self.make_key(kind, paths, params)
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, factory())
+        return value
+
+    def clear(self):
+        """清空缓存（切换文件夹时调用），计数器保留"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """返回命中/未命中次数和当前占用"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self._entries), "bytes": self.current_bytes,
+                    "max_bytes": self.max_bytes}
+
+# 伪彩、叠加和预览共用的缓存
+default_cache = ChannelCache()
@@ -1,6 +1,7 @@
 import os
 from PIL import Image
 import re
+from merge import process_image_sets
 
 def get_prefix(filename):
     """
@@ -35,29 +36,43 @@ def process_image_set(folder_path, prefix):
     combined_img.paste(lu_img, (0, 0))
     combined_img.paste(ru_img, (w1, 0))
     combined_img.paste(ld_img, (0, h1))
-    combined_img.paste(rd_img, (w3, h2))
+    combined_img.paste(rd_img, (w1, h1))  # 与 merge.process_image_set 一致，按 LU 尺寸摆放
 
     # 创建或使用"combined"子文件夹
     combined_folder = os.path.join(folder_path, "combined")
-    if not os.path.exists(combined_folder):
-        os.makedirs(combined_folder)
+    os.makedirs(combined_folder, exist_ok=True)  # 并行处理时可能同时创建
 
     output_path = os.path.join(combined_folder, prefix + "_combined.bmp")
     combined_img.save(output_path)
 
-def main(folder_path):
+def _combine_set(prefix, folder_path, register=False):
+    """process_image_sets 使用的单组处理函数（本脚本不做配准）"""
+    process_image_set(folder_path, prefix)
+    return True
+
+def main(folder_path, max_workers=None):
+    """
+    拼接文件夹中的所有图片组
+
+    返回:
+    (combined 文件夹路径, {前缀: 拼接成功返回True，否则返回False})
+    """
     # 获取所有 bmp 文件
     all_files = [f for f in os.listdir(folder_path) if f.lower().endswith(".bmp")]
 
     # 提取所有前缀并去重
     prefixes = set(get_prefix(f) for f in all_files)
 
-    # 逐一处理对应的四张图片
-    for prefix in prefixes:
-        process_image_set(folder_path, prefix)
-    
-    # 返回 combined 文件夹路径
-    return os.path.join(folder_path, "combined")
+    # 多线程并行处理各组图片，一组出错不影响其他组
+    results = process_image_sets(prefixes, folder_path, max_workers, process=_combine_set)
+
+    failed = sorted(prefix for prefix, ok in results.items() if not ok)
+    print(f"Combined {len(results) - len(failed)} of {len(results)} sets")
+    if failed:
+        print(f"Failed sets: {', '.join(failed)}")
+
+    # 返回 combined 文件夹路径和各组结果，调用方可据此处理失败的组
+    return os.path.join(folder_path, "combined"), results
 
 if __name__ == "__main__":
     # 使用 tkinter 弹出对话框选择文件夹
@@ -69,6 +84,6 @@ if __name__ == "__main__":
 
     folderPath = filedialog.askdirectory(title="请选择一个包含 BMP 图片的文件夹")
     if folderPath:
-        combined_path = main(folderPath)
+        combined_path, _ = main(folderPath)
         # 启动图像叠加工具
         ImageBlender(combined_path)
\ No newline at end of file
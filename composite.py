@@ -0,0 +1,125 @@
+import numpy as np
+from PIL import Image
+from overlay import enhance_rgb, gather_pairs, load_band, pair_data, scale_lut
+from pseudo_color import cached_gray
+
+class CompositeChannel:
+    """
+    合成中的一个灰度通道
+
+    参数:
+    source: 灰度来源（图片路径、PIL Image 或 uint8 二维数组）
+    color: 该通道的颜色 (R, G, B)，强度 255 时贡献该颜色
+    weight: 强度系数，强度 = min(int(灰度 * weight), 255)
+    invert: 是否先反相（255 - 灰度）
+    threshold: 强度低于该值视为背景；所有通道都是背景的像素设为透明
+    lut: 可选的 (256, 3) 颜色查找表，按强度取颜色，给出时忽略 color
+    levels: 可选的 256 级强度表（输入值 -> 强度），给出时忽略 weight 和 invert
+    band: 可选，取图片的该颜色分量（0 红、1 绿、2 蓝）而不是灰度
+    """
+
+    def __init__(self, source, color=(255, 0, 0), weight=1.0, invert=False,
+                 threshold=0, lut=None, levels=None, band=None):
+        self.source = source
+        self.color = color
+        self.weight = weight
+        self.invert = invert
+        self.threshold = threshold
+        self.lut = lut
+        self.levels = levels
+        self.band = band
+
+    def plane(self):
+        """读取灰度平面（给出 band 时为该颜色分量）"""
+        if isinstance(self.source, Image.Image):
+            if self.band is not None:
+                return np.asarray(self.source.convert('RGB'))[..., self.band]
+            return np.asarray(self.source.convert('L'))
+        if self.band is not None:
+            return load_band(self.source, self.band)
+        if isinstance(self.source, np.ndarray):
+            return self.source
+        return cached_gray(self.source)
+
+    def tables(self):
+        """
+        返回:
+        (256 级输入对应的强度, 256 级输入对应的 RGB 贡献)
+        """
+        if self.levels is not None:
+            intensity = np.asarray(self.levels, dtype=np.int64).reshape(256)
+        else:
+            levels = np.arange(256)
+            values = 255 - levels if self.invert else levels
+            intensity = np.minimum((values * self.weight).astype(np.int64), 255)
+        if self.lut is not None:
+            colormap = np.asarray(self.lut, dtype=np.int64).reshape(256, 3)
+        else:
+            colormap = (np.arange(256)[:, None] * np.asarray(self.color, dtype=np.int64)
+                        + 127) // 255
+        return intensity, colormap[intensity]
+
+def red_green_channels(red, green, alpha=0.3, threshold=30):
+    """
+    overlay_images 的红绿叠加对应的通道配置：红色图取红色分量、绿色图取绿色分量，
+    强度表与叠加共用 overlay.scale_lut（反相后先乘 alpha 再乘 2.5），
+    用 composite_planes 合成的结果与 overlay_images 逐字节一致
+    """
+    levels = scale_lut(alpha)
+    return [
+        CompositeChannel(red, color=(255, 0, 0), levels=levels, band=0,
+                         threshold=threshold),
+        CompositeChannel(green, color=(0, 255, 0), levels=levels, band=1,
+                         threshold=threshold),
+    ]
+
+def composite_planes(channels, brightness=0.47, contrast=2.4, saturation=2.33):
+    """
+    把任意数量的灰度通道合成为一张 RGBA 图
+
+    各通道按自己的颜色/查找表、强度系数、反相和阈值计算贡献，贡献相加后截断到
+    0-255，然后做与 overlay_images 相同的亮度/对比度/饱和度调整。
+    两个通道时结果只取决于输入值组合，按组合表一次取值；其余情况对整幅数组
+    逐通道查表累加后统一调整
+
+    参数:
+    channels: CompositeChannel 列表
+
+    返回:
+    (高, 宽, 4) 的 uint8 RGBA 数组
+    """
+    if not channels:
+        raise ValueError("至少需要一个通道")
+    planes = [channel.plane() for channel in channels]
+    if any(plane.shape != planes[0].shape for plane in planes):
+        raise ValueError("各通道图片尺寸不一致")
+    tables = [channel.tables() for channel in channels]
+
+    if len(channels) == 2:
+        (i0, c0), (i1, c1) = tables
+        visible = ((i0 >= channels[0].threshold)[:, None]
+                   | (i1 >= channels[1].threshold)[None, :])
+        rgb = np.minimum(c0[:, None, :] + c1[None, :, :], 255)
+        rgb = np.where(visible[..., None], rgb, 0).astype(np.uint8)
+        pair_index, pair_hist = pair_data(planes[0], planes[1])
+        return gather_pairs(enhance_rgb(rgb, brightness, contrast, saturation, pair_hist),
+                            visible, pair_index)
+
+    # 每个通道按输入值查表得到各颜色分量的贡献，逐分量累加（uint16 不会溢出）
+    rgb = np.zeros((3,) + planes[0].shape, dtype=np.uint16)
+    visible = np.zeros(planes[0].shape, dtype=bool)
+    for channel, plane, (intensity, color) in zip(channels, planes, tables):
+        for k in range(3):
+            rgb[k] += np.take(color[:, k].astype(np.uint16), plane)
+        visible |= np.take(intensity >= channel.threshold, plane)
+    rgb = np.minimum(rgb, 255).astype(np.uint8)
+    rgb = np.where(visible, rgb, 0).transpose(1, 2, 0)
+
+    result = np.empty(planes[0].shape + (4,), dtype=np.uint8)
+    result[..., :3] = enhance_rgb(rgb, brightness, contrast, saturation)
+    result[..., 3] = visible * np.uint8(255)
+    return result
+
+def composite_image(channels, brightness=0.47, contrast=2.4, saturation=2.33):
+    """在内存中合成多个通道，返回 RGBA 模式的 PIL Image"""
+    return Image.fromarray(composite_planes(channels, brightness, contrast, saturation), 'RGBA')
@@ -9,13 +9,25 @@ else:
     application_path = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(application_path)
 
+import importlib
+import threading
+import time
 import tkinter as tk
 from tkinter import ttk, messagebox
 from tkinter.filedialog import askdirectory
-from PIL import Image, ImageTk
-from pseudo_color import convert_to_pseudo_color
-from overlay import overlay_images
-from merge import process_image_set, get_prefix
+from instrument import ENABLED as PROFILE_ENABLED, format_breakdown, stage, timed
+from prefetch import Prefetcher
+from render_worker import RenderWorker
+
+# 处理模块（numpy、PIL 及其插件）在窗口显示后由后台线程预先导入，
+# 各方法在用到时再从模块中导入，窗口不必等待它们加载
+WARM_MODULES = ("numpy", "PIL.Image", "PIL.ImageTk", "channel_cache", "pseudo_color",
+                "overlay", "proxy", "image_stats", "merge", "output_writer", "watch",
+                "zoom_viewer")
+PREVIEW_SIZE = (600, 600)
+
+# 启动基准：设置该环境变量（文件路径）时，窗口可用后写入当时的时间并退出
+STARTUP_ENV = "IMAGE_STARTUP_FILE"
 
 class ImageProcessorGUI:
     def __init__(self, root):
@@ -23,6 +35,10 @@ class ImageProcessorGUI:
         self.root.title("图片处理工具")
         self.root.geometry("1200x800")
         
+        # 滑块调节时使用与预览区域匹配的金字塔层级，导出或"全分辨率渲染"时才用原图
+        # （首次使用时创建，见 proxy_cache）
+        self._proxy_cache = None
+        
         # 创建主框架
         self.main_frame = ttk.Frame(self.root, padding="10")
         self.main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
@@ -36,6 +52,16 @@ class ImageProcessorGUI:
         ttk.Entry(self.folder_frame, textvariable=self.folder_path, width=80).grid(row=0, column=1, padx=5)
         ttk.Button(self.folder_frame, text="浏览", command=self.select_folder).grid(row=0, column=2, padx=5)
         
+        # 监视模式：扫描仪写完一组四张图片后立即合并，下拉框随之更新
+        self.watch_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.folder_frame, text="监视文件夹", variable=self.watch_var,
+                        command=self.toggle_watch).grid(row=0, column=3, padx=5)
+        
+        # 配准：按重叠部分估计象限的实际位置并羽化接缝（扫描仪象限有偏移或重叠时勾选）
+        self.register_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.folder_frame, text="配准接缝",
+                        variable=self.register_var).grid(row=0, column=4, padx=5)
+        
         # 中部 - 图片选择和预览区域
         # 红色通道选择和预览
         self.red_frame = ttk.LabelFrame(self.main_frame, text="红色通道", padding="5")
@@ -44,7 +70,7 @@ class ImageProcessorGUI:
         # 下拉框
         self.red_combobox = ttk.Combobox(self.red_frame, width=40)
         self.red_combobox.grid(row=0, column=0, columnspan=2, padx=5, pady=5)
-        self.red_combobox.bind('<<ComboboxSelected>>', self.update_preview)
+        self.red_combobox.bind('<<ComboboxSelected>>', self.on_select)
         
         # 伪彩色预览
         self.red_preview = ttk.Label(self.red_frame)
@@ -57,7 +83,7 @@ class ImageProcessorGUI:
         # 下拉框
         self.green_combobox = ttk.Combobox(self.green_frame, width=40)
         self.green_combobox.grid(row=0, column=0, columnspan=2, padx=5, pady=5)
-        self.green_combobox.bind('<<ComboboxSelected>>', self.update_preview)
+        self.green_combobox.bind('<<ComboboxSelected>>', self.on_select)
         
         # 伪彩色预览
         self.green_preview = ttk.Label(self.green_frame)
@@ -111,21 +137,88 @@ class ImageProcessorGUI:
         self.threshold_scale.grid(row=1, column=1, sticky=(tk.W, tk.E), padx=5)
         self.threshold_scale.bind("<ButtonRelease-1>", self.update_preview)
         
+        # 导出按钮：只有在这里才把伪彩图和叠加图写入磁盘
+        ttk.Button(self.adjust_frame, text="导出结果", command=self.export_results).grid(row=1, column=2, padx=5)
+        ttk.Button(self.adjust_frame, text="全分辨率渲染",
+                   command=lambda: self.update_preview(full=True)).grid(row=1, column=3, padx=5)
+        
+        # 根据统计索引自动选择阈值/对比度，不需要再遍历像素
+        ttk.Button(self.adjust_frame, text="自动阈值",
+                   command=lambda: self.auto_adjust('threshold')).grid(row=1, column=4, padx=5)
+        ttk.Button(self.adjust_frame, text="自动对比度",
+                   command=lambda: self.auto_adjust('contrast')).grid(row=1, column=5, padx=5)
+        
+        # 原图的缩放平移查看，只渲染可见瓦片
+        ttk.Button(self.adjust_frame, text="放大查看", command=self.open_zoom_viewer).grid(row=1, column=6, padx=5)
+        self.zoom_viewer = None
+        
         # 状态栏
         self.status_var = tk.StringVar()
         self.status_bar = ttk.Label(self.main_frame, textvariable=self.status_var, relief=tk.SUNKEN)
         self.status_bar.grid(row=3, column=0, columnspan=3, sticky=(tk.W, tk.E))
+        
+        # 后台线程：预览渲染带防抖，新请求取代旧请求；合并与导出在另一个线程中
+        # 按提交顺序依次执行，后提交的任务不会取消或丢弃前面的任务
+        self.render_worker = RenderWorker(self.root, on_progress=self.status_var.set)
+        self.task_worker = RenderWorker(self.root, on_progress=self.status_var.set,
+                                        supersede=False)
+        # 自动阈值/对比度单独一个线程，不影响合并和导出；连续点击时只保留最后一次
+        self.adjust_worker = RenderWorker(self.root, on_progress=self.status_var.set)
+        self.watch_worker = RenderWorker(self.root, on_progress=self.on_watch_progress)
+        
+        # 选择后在后台预取相邻的下拉框项，前台渲染或合并时暂停（首次选择时创建）
+        self._prefetcher = None
+        
+        # 窗口显示后再在后台导入处理模块
+        self.root.after_idle(self.warm_up)
+    
+    def warm_up(self):
+        """在后台线程中导入处理模块，第一次合并或预览时不必再等待"""
+        def run():
+            for name in WARM_MODULES:
+                try:
+                    importlib.import_module(name)
+                except Exception as e:
+                    print(f"预先导入 {name} 时出错: {e}")
+        threading.Thread(target=run, name='warm_up', daemon=True).start()
+    
+    @property
+    def proxy_cache(self):
+        """预览代理层级的缓存"""
+        if self._proxy_cache is None:
+            from proxy import ProxyCache
+            self._proxy_cache = ProxyCache(PREVIEW_SIZE)
+        return self._proxy_cache
+    
+    @property
+    def prefetcher(self):
+        """相邻下拉框项的预取器（只在界面线程中使用）"""
+        if self._prefetcher is None:
+            self._prefetcher = Prefetcher(
+                self.root, self.proxy_cache,
+                busy=lambda: (self.render_worker.busy() or self.task_worker.busy()
+                              or self.adjust_worker.busy()))
+        return self._prefetcher
 
     def select_folder(self):
         """选择文件夹并自动处理"""
         folder = askdirectory()
         if folder:
             self.folder_path.set(folder)
-            self.process_folder()
+            if self.watch_var.get():
+                # 监视的第一次扫描就会合并已有的组
+                self.prefetcher.cancel()
+                self.proxy_cache.clear()
+                self.toggle_watch()
+            else:
+                self.process_folder()
     
     def process_folder(self):
-        """处理选中的文件夹"""
+        """处理选中的文件夹（在后台线程中合并，界面保持响应）"""
         folder = self.folder_path.get()
+        self.prefetcher.cancel()
+        self.proxy_cache.clear()
+        self.render_worker.cancel()
         try:
             # 获取所有.bmp文件
             all_files = [f for f in os.listdir(folder) if f.endswith('.bmp')]
@@ -134,34 +227,70 @@ class ImageProcessorGUI:
             if not all_files:
                 messagebox.showinfo("提示", "文件夹中没有找到.bmp文件")
                 return
-                
-            # 获取所有唯一前缀
-            prefixes = list(set(get_prefix(f) for f in all_files))
-            print(f"找到的前缀: {prefixes}")  # 调试信息
-            
-            # 创建combined子文件夹
-            combined_folder = os.path.join(folder, "combined")
-            if not os.path.exists(combined_folder):
-                os.makedirs(combined_folder)
-            
-            # 处理每组图片
-            processed_count = 0
-            for prefix in prefixes:
-                print(f"正在处理前缀: {prefix}")  # 调试信息
-                if process_image_set(prefix, folder):
-                    processed_count += 1
-                    print(f"成功处理前缀: {prefix}")  # 调试信息
+        except Exception as e:
+            messagebox.showerror("错误", f"处理文件夹时出错: {str(e)}")
+            return
+        
+        register = self.register_var.get()
+        
+        def merge_all(job):
+            from merge import merge_folder
+            # 只合并新增或有变化的组，多核并行处理
+            def on_progress(done, total, prefix, ok):
+                job.check()
+                job.progress(f"正在合并 {done}/{total}: {prefix}")
+                print(f"{'成功' if ok else '未能'}处理前缀: {prefix}")  # 调试信息
             
+            results = merge_folder(folder, progress=on_progress, register=register)
+            processed_count = sum(results.values())
             print(f"总共处理成功: {processed_count} 组")  # 调试信息
-            
+            return processed_count
+        
+        def on_done(processed_count):
             if processed_count > 0:
                 self.status_var.set(f"已合并 {processed_count} 组图片到combined文件夹")
                 self.update_comboboxes()
             else:
                 messagebox.showwarning("警告", "没有找到可以合并的完整图片组")
-                
-        except Exception as e:
-            messagebox.showerror("错误", f"处理文件夹时出错: {str(e)}")
+        
+        self.task_worker.submit(
+            merge_all, on_done,
+            lambda e: messagebox.showerror("错误", f"处理文件夹时出错: {str(e)}"),
+            debounce=False)
+    
+    def toggle_watch(self):
+        """开启或关闭文件夹监视（在后台线程中轮询，每合并完一组就刷新下拉框）"""
+        if not self.watch_var.get():
+            self.watch_worker.cancel()
+            self.status_var.set("已停止监视")
+            return
+        folder = self.folder_path.get()
+        if not os.path.isdir(folder):
+            messagebox.showinfo("提示", "请先选择要监视的文件夹")
+            self.watch_var.set(False)
+            return
+        from watch import FolderWatcher
+        watcher = FolderWatcher(folder, register=self.register_var.get())
+        
+        def watch(job):
+            job.progress(f"正在监视: {folder}")
+            while True:
+                job.check()
+                merged = watcher.poll()
+                if merged:
+                    job.progress(f"已合并 {len(merged)} 组: {', '.join(merged)}")
+                time.sleep(watcher.interval)
+        
+        def on_error(e):
+            self.watch_var.set(False)
+            messagebox.showerror("错误", f"监视文件夹时出错: {str(e)}")
+        
+        self.watch_worker.submit(watch, None, on_error, debounce=False)
+    
+    def on_watch_progress(self, message):
+        """监视线程的进度回调（主线程）：显示状态并刷新下拉框"""
+        self.status_var.set(message)
+        self.update_comboboxes()
     
     def update_comboboxes(self):
         """更新下拉框中的图片列表"""
@@ -176,73 +305,255 @@ class ImageProcessorGUI:
             self.red_combobox['values'] = files
             self.green_combobox['values'] = files
     
-    def update_preview(self, event=None):
-        """更新预览图片"""
-        try:
-            red_pseudo = None
-            green_pseudo = None
-            
-            # 获取当前选择的文件名
-            red_file = self.red_combobox.get()
-            green_file = self.green_combobox.get()
-            
-            # 更新通道信息
-            channel_info = ""
-            if red_file and green_file:
-                red_type = red_file.split('_')[0]    # 获取文件名前缀（A/ACT/T/C/G）
-                green_type = green_file.split('_')[0]
-                channel_info = f"红色通道: {red_type}\n绿色通道: {green_type}"
-            self.channel_info.config(text=channel_info)
-            
-            # 获取当前的调节值
-            brightness = self.brightness_var.get()
-            contrast = self.contrast_var.get()
-            saturation = self.color_var.get()
-            threshold = self.threshold_var.get()
-            
-            # 显示当前调节值
-            print(f"当前参数设置 - 亮度: {brightness:.2f}, 对比度: {contrast:.2f}, "
+    def on_select(self, event=None):
+        """下拉框选择变化：刷新预览，并预取前后相邻的项"""
+        self.update_preview()
+        self.prefetcher.prefetch(
+            os.path.join(self.folder_path.get(), "combined"),
+            self.red_combobox['values'], self.red_combobox.current(),
+            self.green_combobox['values'], self.green_combobox.current())
+    
+    def update_preview(self, event=None, full=False):
+        """
+        更新预览图片
+
+        界面参数在主线程读取，渲染提交给后台线程；短时间内的多次调用会合并，
+        只渲染最后一次的参数。full为False时在代理层级上计算（滑块调节），
+        为True时使用原图
+        """
+        # 获取当前选择的文件名
+        red_file = self.red_combobox.get()
+        green_file = self.green_combobox.get()
+        
+        # 更新通道信息
+        channel_info = ""
+        if red_file and green_file:
+            red_type = red_file.split('_')[0]    # 获取文件名前缀（A/ACT/T/C/G）
+            green_type = green_file.split('_')[0]
+            channel_info = f"红色通道: {red_type}\n绿色通道: {green_type}"
+        self.channel_info.config(text=channel_info)
+        
+        # 获取当前的调节值
+        brightness = self.brightness_var.get()
+        contrast = self.contrast_var.get()
+        saturation = self.color_var.get()
+        threshold = self.threshold_var.get()
+        
+        # 显示当前调节值
+        params = (f"当前参数设置 - 亮度: {brightness:.2f}, 对比度: {contrast:.2f}, "
                   f"饱和度: {saturation:.2f}, 背景阈值: {threshold}")
-            self.status_var.set(f"当前参数设置 - 亮度: {brightness:.2f}, 对比度: {contrast:.2f}, "
-                               f"饱和度: {saturation:.2f}, 背景阈值: {threshold}")
+        print(params)
+        self.status_var.set(params)
+        
+        combined_folder = os.path.join(self.folder_path.get(), "combined")
+        if self.zoom_viewer is not None:
+            self.zoom_viewer.refresh()
+        
+        def render(job):
+            with stage('preview') as record:
+                return render_stages(job), record
+        
+        def render_stages(job):
+            from pseudo_color import pseudo_color_image
+            red_plane = None
+            green_plane = None
+            thumbnails = {}
+            level = None if full else self.proxy_cache.target_size
             
-            # 更新红色通道预览
+            # 更新红色通道预览（全部在内存中完成，不写临时文件；灰度平面来自缓存）
             if red_file:
-                red_path = os.path.join(self.folder_path.get(), "combined", red_file)
-                red_pseudo = convert_to_pseudo_color(red_path, 'red')
-                self.show_preview(red_pseudo, self.red_preview, (300, 300))
+                job.progress("正在生成红色通道...")
+                red_path = os.path.join(combined_folder, red_file)
+                red_plane = self.load_plane(red_path, full)
+                red_pseudo = pseudo_color_image(red_plane, 'red')
+                thumbnails['red'] = make_thumbnail(red_pseudo, (300, 300))
+                job.check()
             
             # 更新绿色通道预览
             if green_file:
-                green_path = os.path.join(self.folder_path.get(), "combined", green_file)
-                green_pseudo = convert_to_pseudo_color(green_path, 'green')
-                self.show_preview(green_pseudo, self.green_preview, (300, 300))
+                job.progress("正在生成绿色通道...")
+                green_path = os.path.join(combined_folder, green_file)
+                green_plane = self.load_plane(green_path, full)
+                green_pseudo = pseudo_color_image(green_plane, 'green')
+                thumbnails['green'] = make_thumbnail(green_pseudo, (300, 300))
+                job.check()
             
             # 如果两个通道都选择了，更新合并预览
-            if red_pseudo and green_pseudo:
-                merged = overlay_images(red_pseudo, green_pseudo, 
-                                     brightness=brightness,
-                                     contrast=contrast,
-                                     saturation=saturation,
-                                     threshold=threshold)
+            if red_plane is not None and green_plane is not None:
+                job.progress("正在叠加...")
+                merged = self.overlay_planes(red_path, green_path, red_plane, green_plane,
+                                             level, dict(brightness=brightness,
+                                                         contrast=contrast,
+                                                         saturation=saturation,
+                                                         threshold=threshold))
                 # 增大叠加结果的预览尺寸
-                self.show_preview(merged, self.merge_preview, (600, 600))  # 增大到600x600
-                
-        except Exception as e:
-            messagebox.showerror("错误", f"更新预览时出错: {str(e)}")
+                thumbnails['merge'] = make_thumbnail(merged, (600, 600))  # 增大到600x600
+            return thumbnails
+        
+        def on_done(result):
+            thumbnails, record = result
+            labels = {'red': self.red_preview, 'green': self.green_preview,
+                      'merge': self.merge_preview}
+            for key, thumbnail in thumbnails.items():
+                self.show_preview(thumbnail, labels[key])
+            from channel_cache import default_cache
+            stats = default_cache.stats()
+            status = (f"{params}  |  缓存命中 {stats['hits']}/"
+                      f"{stats['hits'] + stats['misses']}, "
+                      f"占用 {stats['bytes'] / 1048576:.0f}MB")
+            if PROFILE_ENABLED:
+                # 开启计时（环境变量 IMAGE_PROFILE）时显示本次刷新各阶段的耗时
+                status += f"  |  {format_breakdown(record)}"
+            self.status_var.set(status)
+        
+        self.render_worker.submit(
+            render, on_done,
+            lambda e: messagebox.showerror("错误", f"更新预览时出错: {str(e)}"))
     
-    def show_preview(self, image_path, label, size):
-        """在指定的Label中显示预览图片"""
+    def export_results(self):
+        """将当前选择的伪彩图和叠加图导出到combined文件夹"""
+        red_file = self.red_combobox.get()
+        green_file = self.green_combobox.get()
+        if not red_file or not green_file:
+            messagebox.showinfo("提示", "请先选择红色和绿色通道图片")
+            return
+        combined_folder = os.path.join(self.folder_path.get(), "combined")
+        red_name = os.path.splitext(red_file)[0] + "_red"
+        green_name = os.path.splitext(green_file)[0] + "_green"
+        params = dict(brightness=self.brightness_var.get(),
+                      contrast=self.contrast_var.get(),
+                      saturation=self.color_var.get(),
+                      threshold=self.threshold_var.get())
+        
+        def export(job):
+            from output_writer import save_image
+            from pseudo_color import pseudo_color_image
+            job.progress("正在导出伪彩图...")
+            red_path = os.path.join(combined_folder, red_file)
+            green_path = os.path.join(combined_folder, green_file)
+            red_plane = self.load_plane(red_path, True)
+            green_plane = self.load_plane(green_path, True)
+            save_image(pseudo_color_image(red_plane, 'red'), os.path.join(combined_folder, f"{red_name}.bmp"))
+            save_image(pseudo_color_image(green_plane, 'green'), os.path.join(combined_folder, f"{green_name}.bmp"))
+            job.progress("正在导出叠加图...")
+            merged = self.overlay_planes(red_path, green_path, red_plane, green_plane, None, params)
+            save_image(merged, os.path.join(combined_folder, f"{red_name}_{green_name}_overlay.bmp"))
+            return combined_folder
+        
+        self.task_worker.submit(
+            export, lambda folder: self.status_var.set(f"已导出到: {folder}"),
+            lambda e: messagebox.showerror("错误", f"导出结果时出错: {str(e)}"),
+            debounce=False)
+    
+    def open_zoom_viewer(self):
+        """在单独的窗口中按瓦片查看原图：两个通道都选择时为叠加图，否则为所选通道的伪彩图"""
+        red_file = self.red_combobox.get()
+        green_file = self.green_combobox.get()
+        if not red_file and not green_file:
+            messagebox.showinfo("提示", "请先选择要查看的图片")
+            return
+        combined_folder = os.path.join(self.folder_path.get(), "combined")
+        if self.zoom_viewer is None:
+            from zoom_viewer import ZoomViewer
+            self.zoom_viewer = ZoomViewer(self.root, params=self.current_params)
+        self.zoom_viewer.open(os.path.join(combined_folder, red_file) if red_file else None,
+                              os.path.join(combined_folder, green_file) if green_file else None)
+    
+    def current_params(self):
+        """当前的叠加调节参数"""
+        return dict(brightness=self.brightness_var.get(),
+                    contrast=self.contrast_var.get(),
+                    saturation=self.color_var.get(),
+                    threshold=self.threshold_var.get())
+    
+    def auto_adjust(self, target):
+        """
+        按当前两张图片的组合直方图自动设置背景阈值或对比度
+
+        组合直方图保存在combined文件夹的统计索引中，首次计算后再次使用不必读取像素
+        """
+        red_file = self.red_combobox.get()
+        green_file = self.green_combobox.get()
+        if not red_file or not green_file:
+            messagebox.showinfo("提示", "请先选择红色和绿色通道图片")
+            return
+        combined_folder = os.path.join(self.folder_path.get(), "combined")
+        brightness = self.brightness_var.get()
+        threshold = self.threshold_var.get()
+        
+        def compute(job):
+            from image_stats import auto_contrast, auto_threshold, pair_histogram
+            job.progress("正在读取统计索引...")
+            hist = pair_histogram(os.path.join(combined_folder, red_file),
+                                  os.path.join(combined_folder, green_file))
+            if target == 'threshold':
+                return auto_threshold(hist)
+            return auto_contrast(hist, brightness=brightness, threshold=threshold)
+        
+        def on_done(value):
+            if target == 'threshold':
+                self.threshold_var.set(value)
+            else:
+                self.contrast_var.set(round(value, 2))
+            self.update_preview()
+        
+        self.adjust_worker.submit(
+            compute, on_done,
+            lambda e: messagebox.showerror("错误", f"自动调节时出错: {str(e)}"),
+            debounce=False)
+    
+    def load_plane(self, image_path, full):
+        """返回灰度平面：full为True时为原图，否则为预览代理层级（均经缓存）"""
+        if full:
+            from pseudo_color import cached_gray
+            return cached_gray(image_path)
+        return self.proxy_cache.get(image_path)
+    
+    def overlay_planes(self, red_path, green_path, red_plane, green_plane, level, params):
+        """
+        叠加两个灰度平面
+
+        组合索引按源文件和层级缓存，来回切换通道或只调节参数时不必重新计算
+        """
+        from PIL import Image
+        from channel_cache import default_cache
+        from overlay import overlay_pairs, pair_data
+        if level is None:
+            pairs = default_cache.get_or_create(
+                'pairs', [red_path, green_path], ('gray', level),
+                lambda: pair_data(red_plane, green_plane))
+        else:
+            # 代理层级的组合索引可能已由预取生成
+            pairs = self.proxy_cache.pairs(red_path, green_path)
+        return Image.fromarray(overlay_pairs(*pairs, **params), 'RGBA')
+    
+    def show_preview(self, thumbnail, label):
+        """在指定的Label中显示已缩略的预览图片（必须在主线程调用）"""
         try:
-            image = Image.open(image_path)
-            image.thumbnail(size, Image.Resampling.LANCZOS)
-            photo = ImageTk.PhotoImage(image)
+            from PIL import ImageTk
+            photo = ImageTk.PhotoImage(thumbnail)
             label.configure(image=photo)
             label.image = photo  # 保持引用
         except Exception as e:
             print(f"预览图片时出错: {str(e)}")
 
+@timed('thumbnail')
+def make_thumbnail(image, size):
+    """生成预览缩略图，不修改原图（可在后台线程调用）"""
+    from PIL import Image
+    thumbnail = image.copy()
+    thumbnail.thumbnail(size, Image.Resampling.LANCZOS)
+    return thumbnail
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = ImageProcessorGUI(root)
-    root.mainloop() 
\ No newline at end of file
+    startup_file = os.environ.get(STARTUP_ENV)
+    if startup_file:
+        # 处理完首批事件（窗口已显示并绘制）即视为可用
+        root.update()
+        with open(startup_file, 'w') as f:
+            f.write(repr(time.time()))
+        root.destroy()
+    else:
+        root.mainloop() 
\ No newline at end of file
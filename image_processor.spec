@@ -2,6 +2,21 @@
 
 block_cipher = None
 
+# 程序用不到的模块：构建环境中装有这些包时 PyInstaller 会顺带打包，
+# 使 PYZ 和 base_library.zip 变大、启动时解压和查找变慢
+EXCLUDES = [
+    'setuptools', 'pkg_resources', '_distutils_hack', 'distutils',
+    'numpy.f2py', 'numpy.distutils', 'numpy.testing',
+    'yaml', 'packaging', 'platformdirs', 'psutil',
+    'asyncio', 'unittest', 'doctest', 'pydoc', 'pdb', 'xmlrpc', 'lib2to3', 'tkinter.test',
+    'IPython', 'matplotlib', 'scipy', 'pandas', 'PyQt5', 'PyQt6', 'PySide2', 'PySide6',
+    # PIL 只需要 BMP/PNG/TIFF/JPEG/GIF 插件（Image.preinit 导入失败的插件会被跳过）
+    'PIL.ImageQt', 'PIL.ImageShow', 'PIL.ImageCms', 'PIL.ImageWin',
+    'PIL.PdfImagePlugin', 'PIL.PdfParser', 'PIL.EpsImagePlugin', 'PIL.WebPImagePlugin',
+    'PIL.FpxImagePlugin', 'PIL.MicImagePlugin', 'PIL.SpiderImagePlugin',
+    'PIL.WmfImagePlugin', 'PIL.IcnsImagePlugin', 'PIL.PsdImagePlugin',
+]
+
 a = Analysis(
     ['gui.py'],  # 主程序入口
     pathex=[],
@@ -11,7 +26,7 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=EXCLUDES,
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
@@ -19,24 +34,34 @@ a = Analysis(
 )
 pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
 
+# 目录模式（onedir）：单文件模式每次启动都要把全部库解压到临时目录，
+# 这是冷启动最慢的部分；目录模式直接从 dist/图片处理工具/ 加载。
+# 不使用 UPX：压缩过的 DLL 每次加载都要解压
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.zipfiles,
-    a.datas,
     [],
+    exclude_binaries=True,
     name='图片处理工具',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
+    upx=False,
     console=False,  # 设置为False以隐藏控制台窗口
     disable_windowed_traceback=False,
     target_arch=None,
     codesign_identity=None,
     entitlements_file=None,
     icon='icon.ico',  # 如果你有图标文件的话
+)
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.zipfiles,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='图片处理工具',
 ) 
\ No newline at end of file
@@ -0,0 +1,138 @@
+import json
+import os
+import numpy as np
+from bmp_io import temp_path
+from overlay import contrast_mean, pair_data, pair_levels
+from pseudo_color import cached_gray
+
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+PAIRS_SUFFIX = ".pairs.npz"
+
+def _source_info(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def histogram_percentiles(hist, percentiles=PERCENTILES):
+    """由 256 级直方图求百分位数（取累计比例首次达到该百分比的灰度级）"""
+    cumulative = np.cumsum(hist)
+    total = cumulative[-1]
+    if total == 0:
+        return {str(p): 0 for p in percentiles}
+    return {str(p): int(np.searchsorted(cumulative, total * p / 100.0))
+            for p in percentiles}
+
+def pair_histogram(red_path, green_path):
+    """
+    读取两张合并图灰度的组合直方图（65536 级）
+
+    结果保存在红色通道图片旁的 <红色图片>__<绿色图片文件名>.pairs.npz 中，
+    两个源文件均未变化时直接读取。任何一组叠加参数的统计都只需这张直方图
+    """
+    sidecar = f"{red_path}__{os.path.basename(green_path)}{PAIRS_SUFFIX}"
+    sources = json.dumps([_source_info(red_path), _source_info(green_path)])
+    try:
+        with np.load(sidecar) as data:
+            if str(data["sources"]) == sources:
+                return data["hist"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    _, hist = pair_data(cached_gray(red_path), cached_gray(green_path))
+    tmp_path = temp_path(sidecar)
+    # 传文件对象，savez 不会给临时文件名加 .npz 扩展名
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, hist=hist, sources=np.array(sources))
+    os.replace(tmp_path, sidecar)
+    return hist
+
+def remove_pair_histograms(image_path):
+    """
+    删除与该图片有关的组合直方图（该图片作为红色或绿色通道），
+    图片被删除时调用，避免留下无主的 .pairs.npz
+
+    返回:
+    list: 删除的文件路径
+    """
+    folder, name = os.path.split(image_path)
+    removed = []
+    try:
+        files = os.listdir(folder or ".")
+    except OSError:
+        return removed
+    for f in files:
+        if not f.endswith(PAIRS_SUFFIX):
+            continue
+        red, _, green = f[:-len(PAIRS_SUFFIX)].partition("__")
+        if name in (red, green):
+            path = os.path.join(folder, f)
+            try:
+                os.remove(path)
+                removed.append(path)
+            except OSError:
+                pass
+    return removed
+
+def overlay_stats(pair_hist, alpha=0.3, brightness=0.47, threshold=30):
+    """
+    由组合直方图计算一组叠加参数下的统计，不需要访问像素
+
+    返回:
+    dict: 非背景像素数、对比度均值、亮度调整后非背景像素的灰度百分位数、
+          反相缩放后亮度最高通道的直方图
+    """
+    r, g, visible = pair_levels(alpha, threshold)
+    mean, _, bright_gray = contrast_mean(pair_hist, r, g, brightness)
+    weights = np.asarray(pair_hist).reshape(256, 256)
+
+    visible_weights = np.where(visible, weights, 0).ravel()
+    gray_hist = np.bincount(bright_gray.ravel(), weights=visible_weights, minlength=256)
+
+    # 不考虑阈值时，每个组合中较亮通道的值决定它是否会被当作背景
+    unmasked_r, unmasked_g, _ = pair_levels(alpha, 0)
+    peak = np.maximum(unmasked_r, unmasked_g).ravel()
+    peak_hist = np.bincount(peak, weights=weights.ravel(), minlength=256)
+
+    return {
+        "pixels": int(weights.sum()),
+        "foreground": int(visible_weights.sum()),
+        "contrast_mean": mean,
+        "percentiles": histogram_percentiles(gray_hist),
+        "peak_histogram": peak_hist,
+    }
+
+def auto_threshold(pair_hist, alpha=0.3):
+    """
+    自动选择背景阈值：对较亮通道值的直方图使用 Otsu 方法分割前景和背景
+    """
+    hist = overlay_stats(pair_hist, alpha, threshold=0)["peak_histogram"]
+    total = hist.sum()
+    if total == 0:
+        return 0
+    levels = np.arange(256)
+    weight_bg = np.cumsum(hist)
+    weight_fg = total - weight_bg
+    sum_bg = np.cumsum(hist * levels)
+    mean_bg = np.divide(sum_bg, weight_bg, out=np.zeros(256), where=weight_bg > 0)
+    mean_fg = np.divide(sum_bg[-1] - sum_bg, weight_fg, out=np.zeros(256), where=weight_fg > 0)
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    # 阈值 t 表示 >= t 为前景，而 between[k] 对应以 k 为背景上限的分割
+    return min(int(np.argmax(between)) + 1, 255)
+
+def auto_contrast(pair_hist, alpha=0.3, brightness=0.47, threshold=30,
+                  low=1, high=99, limits=(0.1, 3.0)):
+    """
+    自动选择对比度：使非背景像素灰度的 low~high 百分位刚好拉伸到 0~255
+
+    ImageEnhance.Contrast 以全图均值为中心拉伸，因此取上下两端都不溢出的最大系数
+    """
+    stats = overlay_stats(pair_hist, alpha, brightness, threshold)
+    mean = stats["contrast_mean"]
+    bottom = stats["percentiles"].get(str(low), 0)
+    top = stats["percentiles"].get(str(high), 255)
+    factors = []
+    if top > mean:
+        factors.append((255 - mean) / (top - mean))
+    if bottom < mean:
+        factors.append(mean / (mean - bottom))
+    factor = min(factors) if factors else 1.0
+    return float(min(max(factor, limits[0]), limits[1]))
@@ -0,0 +1,139 @@
+import functools
+import json
+import os
+import threading
+import time
+
+ENV_VAR = "IMAGE_PROFILE"
+DEFAULT_LOG = "image_profile.jsonl"
+
+# 环境变量 IMAGE_PROFILE 为日志文件路径（设为 1 时写入当前目录的
+# image_profile.jsonl）；未设置时所有计时和计数都是空操作
+_setting = os.environ.get(ENV_VAR, "").strip()
+if _setting.lower() in ("", "0", "false", "off"):
+    LOG_PATH = None
+elif _setting.lower() in ("1", "true", "on"):
+    LOG_PATH = DEFAULT_LOG
+else:
+    LOG_PATH = _setting
+ENABLED = LOG_PATH is not None
+
+_local = threading.local()
+_write_lock = threading.Lock()
+
+class Stage:
+    """
+    一个计时阶段（用作 with 语句）
+
+    阶段可以嵌套：子阶段的耗时记入父阶段的 children，计数同时累加到父阶段。
+    每个阶段结束时向日志写一行 JSON：
+    {"time", "stage", "parent", "thread", "seconds", "children", 各计数...}
+    """
+
+    __slots__ = ('name', 'parent', 'counters', 'children', 'seconds', '_start')
+
+    def __init__(self, name):
+        self.name = name
+        self.parent = None
+        self.counters = {}
+        self.children = {}
+        self.seconds = 0.0
+        self._start = 0.0
+
+    def add(self, **counters):
+        """累加计数，如 bytes_read、bytes_written、pixels、cache_hits"""
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent = stack[-1] if stack else None
+        stack.append(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._start
+        _stack().pop()
+        if self.parent is not None:
+            children = self.parent.children
+            children[self.name] = children.get(self.name, 0.0) + self.seconds
+            self.parent.add(**self.counters)
+        record = {"time": time.time(), "stage": self.name,
+                  "parent": self.parent.name if self.parent is not None else None,
+                  "thread": threading.current_thread().name,
+                  "seconds": round(self.seconds, 6),
+                  "children": {k: round(v, 6) for k, v in self.children.items()}}
+        record.update(self.counters)
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        _write(record)
+        return False
+
+class _NullStage:
+    """关闭时使用的空阶段"""
+
+    __slots__ = ()
+    name = None
+    counters = {}
+    children = {}
+    seconds = 0.0
+
+    def add(self, **counters):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NULL_STAGE = _NullStage()
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+def _write(record):
+    line = json.dumps(record, ensure_ascii=False)
+    with _write_lock:
+        with open(LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+
+def stage(name):
+    """返回名为 name 的计时阶段；关闭时返回共享的空阶段"""
+    if not ENABLED:
+        return NULL_STAGE
+    return Stage(name)
+
+def add(**counters):
+    """给当前线程正在执行的阶段累加计数，没有阶段或关闭时忽略"""
+    if ENABLED:
+        stack = _stack()
+        if stack:
+            stack[-1].add(**counters)
+
+def timed(name):
+    """
+    函数装饰器：每次调用记为一个阶段
+
+    关闭时直接返回原函数，不增加任何调用开销
+    """
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def format_breakdown(stage_record):
+    """把阶段的子阶段耗时格式化为状态栏文字，如 "decode 0.12s, overlay 0.05s, 合计 0.20s" """
+    parts = [f"{name} {seconds:.2f}s" for name, seconds in stage_record.children.items()]
+    parts.append(f"合计 {stage_record.seconds:.2f}s")
+    return ", ".join(parts)
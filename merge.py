@@ -1,18 +1,34 @@
+import hashlib
+import json
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import numpy as np
 from PIL import Image
+from bmp_io import BmpReader, BmpWriter, UnsupportedBmp, read_gray, rgb_to_gray, temp_path
+from image_stats import remove_pair_histograms
+from instrument import add, timed
+from output_writer import save_image
+from registration import cached_positions, stitch_registered
+
+QUADRANTS = ("LD", "LU", "RD", "RU")
+MANIFEST_NAME = "manifest.json"
+STRIP_ROWS = 256  # 流式拼接每次读写的行数
 
 def get_prefix(filename):
     """提取唯一前缀的函数"""
     return re.sub(r"_(LD|LU|RD|RU)\.bmp$", "", filename)
 
-def process_image_set(prefix, folder_path):
+@timed('merge_set')
+def process_image_set(prefix, folder_path, register=False):
     """
     处理一组图片
     
     参数:
     prefix: 图片前缀
     folder_path: 源文件夹路径
+    register: 是否先由重叠部分估计四张图片的实际位置，并在接缝处羽化过渡
+              （扫描仪象限有偏移或重叠时使用）；False 时按名义位置直接拼接
     
     返回:
     bool: 处理成功返回True，否则返回False
@@ -20,29 +36,294 @@ def process_image_set(prefix, folder_path):
     try:
         # 创建输出子文件夹
         output_folder = os.path.join(folder_path, "combined")
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
-
-        # 读取该组的四张图片
-        ld_image = Image.open(os.path.join(folder_path, f"{prefix}_LD.bmp"))
-        lu_image = Image.open(os.path.join(folder_path, f"{prefix}_LU.bmp"))
-        rd_image = Image.open(os.path.join(folder_path, f"{prefix}_RD.bmp"))
-        ru_image = Image.open(os.path.join(folder_path, f"{prefix}_RU.bmp"))
-
-        # 拼接图片
-        width, height = lu_image.size
-        combined_image = Image.new('RGB', (width * 2, height * 2))
-        combined_image.paste(lu_image, (0, 0))
-        combined_image.paste(ru_image, (width, 0))
-        combined_image.paste(ld_image, (0, height))
-        combined_image.paste(rd_image, (width, height))
-
-        # 导出拼接后的图片
+        os.makedirs(output_folder, exist_ok=True)  # 并行处理时可能同时创建
+
         output_path = os.path.join(output_folder, f"{prefix}_combined.bmp")
-        combined_image.save(output_path)
+        paths = {q: os.path.join(folder_path, f"{prefix}_{q}.bmp") for q in QUADRANTS}
+        if register:
+            # 同一设置的偏移缓存在 combined/registration.json 中
+            stitch_registered(paths, output_path, cached_positions(paths, output_folder))
+        else:
+            try:
+                # 优先按行条流式拼接，内存占用与图片尺寸无关
+                stitch_streaming(paths, output_path)
+            except UnsupportedBmp:
+                # 压缩、16位或四张尺寸不一致等情况回退到整幅拼接
+                stitch_in_memory(paths, output_path)
+        add(bytes_read=sum(os.path.getsize(p) for p in paths.values()),
+            bytes_written=os.path.getsize(output_path))
         print(f"Processed and saved: {output_path}")
         return True  # 明确返回成功
         
     except Exception as e:
         print(f"Error processing prefix {prefix}: {e}")
         return False  # 明确返回失败
+
+def stitch_in_memory(paths, output_path):
+    """
+    用 PIL 整幅读取四张图片并拼接
+
+    参数:
+    paths: {象限: 图片路径}
+    output_path: 输出路径
+    """
+    # 读取该组的四张图片
+    ld_image = Image.open(paths["LD"])
+    lu_image = Image.open(paths["LU"])
+    rd_image = Image.open(paths["RD"])
+    ru_image = Image.open(paths["RU"])
+
+    # 拼接图片
+    width, height = lu_image.size
+    combined_image = Image.new('RGB', (width * 2, height * 2))
+    combined_image.paste(lu_image, (0, 0))
+    combined_image.paste(ru_image, (width, 0))
+    combined_image.paste(ld_image, (0, height))
+    combined_image.paste(rd_image, (width, height))
+
+    # 导出拼接后的图片
+    save_image(combined_image, output_path)
+
+def stitch_streaming(paths, output_path, strip_rows=STRIP_ROWS, gray_out=None):
+    """
+    按水平行条流式拼接四张未压缩BMP，直接写出合并后的BMP
+
+    BMP 按自下而上存储，因此先写下半部分（LD | RD），再写上半部分（LU | RU），
+    任意时刻只保留 strip_rows 行的数据。四张图片尺寸不一致或格式不支持时
+    抛出 UnsupportedBmp。
+
+    参数:
+    paths: {象限: 图片路径}
+    output_path: 输出路径
+    strip_rows: 每次读写的行数
+    gray_out: 可选，(2*高, 2*宽) 的 uint8 数组，写出的同时填入合并图的灰度，
+              供后续伪彩/叠加使用而无需再次读取
+    """
+    readers = {q: BmpReader(paths[q]) for q in QUADRANTS}
+    width, height = readers["LU"].size
+    if any(reader.size != (width, height) for reader in readers.values()):
+        raise UnsupportedBmp("四张图片尺寸不一致")
+
+    written = 0
+    with BmpWriter(output_path, width * 2, height * 2) as writer:
+        for left, right in ((readers["LD"], readers["RD"]), (readers["LU"], readers["RU"])):
+            for start in range(0, height, strip_rows):
+                rows = np.concatenate((left.read_rows(start, strip_rows),
+                                       right.read_rows(start, strip_rows)), axis=1)
+                writer.write_rows(rows)
+                if gray_out is not None:
+                    # 行条自下而上，灰度图按从上到下存放
+                    bottom = height * 2 - written
+                    gray_out[bottom - len(rows):bottom] = rgb_to_gray(
+                        rows[..., 2], rows[..., 1], rows[..., 0])[::-1]
+                written += len(rows)
+
+def stitch_gray(paths):
+    """
+    只在内存中拼接四张图片的灰度，不写文件
+
+    结果与先拼接为RGB再 convert('L') 相同；尺寸不一致时按 LU 尺寸摆放并裁剪，
+    与 stitch_in_memory 一致
+
+    参数:
+    paths: {象限: 图片路径}
+
+    返回:
+    (2*高, 2*宽) 的 uint8 数组
+    """
+    planes = {q: read_gray(paths[q]) for q in QUADRANTS}
+    height, width = planes["LU"].shape
+    gray = np.zeros((height * 2, width * 2), dtype=np.uint8)
+    for quadrant, (x, y) in (("LU", (0, 0)), ("RU", (width, 0)),
+                             ("LD", (0, height)), ("RD", (width, height))):
+        plane = planes[quadrant][:height * 2 - y, :width * 2 - x]
+        gray[y:y + plane.shape[0], x:x + plane.shape[1]] = plane
+    return gray
+
+def process_image_sets(prefixes, folder_path, max_workers=None, use_processes=False,
+                       progress=None, register=False, process=None):
+    """
+    并行处理多组图片
+
+    参数:
+    prefixes: 图片前缀列表
+    folder_path: 源文件夹路径
+    max_workers: 并行数，None 表示按CPU核数
+    use_processes: True 使用进程池，False 使用线程池（PIL 解码/编码时会释放GIL）
+    progress: 每完成一组调用 progress(已完成数, 总数, 前缀, 是否成功)，
+              回调抛出异常时取消尚未开始的任务并向上抛出
+    register: 同 process_image_set
+    process: 处理一组的函数 process(前缀, 文件夹, register)，默认 process_image_set；
+             返回是否成功，抛出异常视为失败（使用进程池时必须是模块级函数）
+
+    返回:
+    dict: {前缀: 处理成功返回True，否则返回False}
+    """
+    if process is None:
+        process = process_image_set
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+
+    results = {}
+    pool = executor_class(max_workers=max_workers)
+    try:
+        futures = {pool.submit(process, prefix, folder_path, register): prefix
+                   for prefix in prefixes}
+        for future in as_completed(futures):
+            prefix = futures[future]
+            try:
+                results[prefix] = future.result()
+            except Exception as e:
+                print(f"Error processing prefix {prefix}: {e}")
+                results[prefix] = False
+            if progress is not None:
+                progress(len(results), len(futures), prefix, results[prefix])
+    except BaseException:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+    return results
+
+def _file_hash(path):
+    """计算文件的 sha1"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _file_stat(path):
+    """记录文件大小和修改时间"""
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def load_manifest(output_folder):
+    """读取combined文件夹中的清单，不存在或损坏时返回空清单"""
+    try:
+        with open(os.path.join(output_folder, MANIFEST_NAME), encoding='utf-8') as f:
+            manifest = json.load(f)
+        if isinstance(manifest.get("sets"), dict):
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {"version": 1, "sets": {}}
+
+def save_manifest(output_folder, manifest):
+    """写入清单（先写临时文件再替换，避免中途中断留下半个文件）"""
+    path = os.path.join(output_folder, MANIFEST_NAME)
+    tmp_path = temp_path(path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+def _sources_unchanged(folder_path, prefix, entry, use_hash):
+    """
+    判断该组源文件是否与清单记录一致
+
+    大小和修改时间一致即视为未变化；不一致且启用 use_hash 时再比较内容哈希，
+    哈希相同则只更新清单中的时间戳
+    """
+    recorded = entry.get("sources", {})
+    for quadrant in QUADRANTS:
+        path = os.path.join(folder_path, f"{prefix}_{quadrant}.bmp")
+        old = recorded.get(quadrant)
+        if old is None:
+            return False
+        stat = _file_stat(path)
+        if stat["size"] == old.get("size") and stat["mtime_ns"] == old.get("mtime_ns"):
+            continue
+        if not use_hash or stat["size"] != old.get("size") or "sha1" not in old:
+            return False
+        if _file_hash(path) != old["sha1"]:
+            return False
+        old.update(stat)
+    return True
+
+def _output_unchanged(output_folder, prefix, entry):
+    """判断合并结果是否仍是清单记录的那个文件"""
+    output_path = os.path.join(output_folder, f"{prefix}_combined.bmp")
+    try:
+        return _file_stat(output_path) == entry.get("output")
+    except OSError:
+        return False
+
+def merge_folder(folder_path, max_workers=None, use_hash=False, progress=None, prefixes=None,
+                 register=False):
+    """
+    增量合并文件夹中的所有图片组
+
+    借助combined文件夹中的清单(manifest.json)，只合并新增或源文件有变化的组，
+    并删除源文件已不存在或已不完整（缺少部分象限）的组留下的合并结果
+
+    参数:
+    folder_path: 源文件夹路径
+    max_workers: 并行数，None 表示按CPU核数
+    use_hash: 是否记录并比较源文件内容哈希（文件被复制导致时间戳变化时仍可跳过）
+    progress: 同 process_image_sets，只对实际合并的组调用
+    prefixes: 只检查这些组（文件夹监视时只交给已写完的组），None 表示全部
+    register: 同 process_image_set；与上次合并时的设置不同的组会重新合并
+
+    返回:
+    dict: {前缀: 合并结果可用返回True，否则返回False}
+    """
+    output_folder = os.path.join(folder_path, "combined")
+    os.makedirs(output_folder, exist_ok=True)
+    manifest = load_manifest(output_folder)
+    entries = manifest["sets"]
+
+    all_files = [f for f in os.listdir(folder_path) if f.endswith('.bmp')]
+    present = set(get_prefix(f) for f in all_files)
+
+    results = {}
+    stale = []
+    incomplete = set()
+    for prefix in (present if prefixes is None else present & set(prefixes)):
+        if not all(f"{prefix}_{quadrant}.bmp" in all_files for quadrant in QUADRANTS):
+            results[prefix] = False  # 四张图片不全
+            incomplete.add(prefix)
+            continue
+        entry = entries.get(prefix)
+        if (entry is not None and entry.get("register", False) == register
+                and _output_unchanged(output_folder, prefix, entry)
+                and _sources_unchanged(folder_path, prefix, entry, use_hash)):
+            results[prefix] = True
+        else:
+            stale.append(prefix)
+
+    # 删除源文件已不存在或已不完整的组的合并结果及其组合直方图
+    for prefix in [p for p in entries if p not in present or p in incomplete]:
+        output_path = os.path.join(output_folder, f"{prefix}_combined.bmp")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+            print(f"Removed orphaned output: {output_path}")
+        remove_pair_histograms(output_path)
+        del entries[prefix]
+
+    print(f"Skipped {sum(results.values())} unchanged sets, merging {len(stale)}")
+
+    # 合并前记录源文件状态，合并期间被改写的文件下次仍会重新合并
+    sources = {}
+    for prefix in stale:
+        sources[prefix] = {}
+        for quadrant in QUADRANTS:
+            path = os.path.join(folder_path, f"{prefix}_{quadrant}.bmp")
+            sources[prefix][quadrant] = _file_stat(path)
+            if use_hash:
+                sources[prefix][quadrant]["sha1"] = _file_hash(path)
+
+    merged = process_image_sets(stale, folder_path, max_workers, progress=progress,
+                                register=register)
+    for prefix, ok in merged.items():
+        results[prefix] = ok
+        if not ok:
+            entries.pop(prefix, None)
+            continue
+        entries[prefix] = {
+            "sources": sources[prefix],
+            "output": _file_stat(os.path.join(output_folder, f"{prefix}_combined.bmp")),
+            "register": register,
+        }
+
+    save_manifest(output_folder, manifest)
+    return results
@@ -0,0 +1,138 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from bmp_io import temp_path
+from instrument import stage
+
+# 输出格式 -> (扩展名, PIL 格式, 保存参数)
+FORMATS = {
+    'bmp': ('.bmp', 'BMP', {}),
+    'png': ('.png', 'PNG', {'compress_level': 1}),      # 最快的压缩级别
+    'tiff': ('.tif', 'TIFF', {'compression': 'tiff_adobe_deflate'}),
+    'npy': ('.npy', None, {}),                          # 原始数组，供下游分析
+}
+DEFAULT_FORMAT = 'bmp'
+
+def output_name(name, fmt=DEFAULT_FORMAT):
+    """输出文件名：name 加上格式对应的扩展名"""
+    return name + FORMATS[fmt][0]
+
+def save_image(image, path, fmt=None):
+    """
+    按格式保存图片，先写入同目录的临时文件再替换，不会留下写了一半的文件
+
+    参数:
+    image: PIL Image 或 uint8 数组
+    path: 输出路径
+    fmt: FORMATS 中的格式，None 表示按扩展名判断
+
+    返回:
+    str: 输出路径
+    """
+    if fmt is None:
+        ext = os.path.splitext(path)[1].lower()
+        fmt = next((key for key, value in FORMATS.items() if value[0] == ext), None)
+    if fmt is None:
+        # 其他扩展名（如 .jpg）按 PIL 的默认参数保存
+        pil_format, options = Image.registered_extensions()[ext], {}
+    else:
+        _, pil_format, options = FORMATS[fmt]
+    tmp_path = temp_path(path)
+    with stage('encode') as s:
+        try:
+            if pil_format is None:
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, np.asarray(image))
+            else:
+                if isinstance(image, np.ndarray):
+                    image = Image.fromarray(image)
+                image.save(tmp_path, pil_format, **options)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        s.add(bytes_written=os.path.getsize(path))
+    return path
+
+class OutputWriter:
+    """
+    后台编码和写出结果的线程池
+
+    submit 把编码和写文件交给后台线程，调用方可以继续计算下一张；
+    排队和正在写出的图片超过 max_pending 张时 submit 阻塞，等前面的写完
+    再返回（背压），内存中等待写出的图片数因此有上限。
+    PIL 编码和写文件时释放 GIL，多个写出线程可以并行。
+    用作 with 语句时退出前等待全部写完
+    """
+
+    def __init__(self, max_workers=2, max_pending=4):
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers,
+                                        thread_name_prefix='output_writer')
+        self._lock = threading.Lock()
+        self._futures = []
+        self.errors = []
+
+    def submit(self, image, path, fmt=None):
+        """
+        提交一张图片（写出完成前不得再修改 image）
+
+        返回:
+        Future: 结果为输出路径；出错时异常同时记入 errors
+        """
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self._write, image, path, fmt)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._futures = [f for f in self._futures if not f.done()]
+            self._futures.append(future)
+        return future
+
+    def _write(self, image, path, fmt):
+        try:
+            return save_image(image, path, fmt)
+        except Exception as e:
+            print(f"写出 {path} 时出错: {e}")
+            with self._lock:
+                self.errors.append((path, e))
+            raise
+        finally:
+            self._slots.release()
+
+    def wait(self):
+        """等待已提交的图片全部写完，返回出错的 [(路径, 异常)]"""
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass  # 已记入 errors
+        with self._lock:
+            return list(self.errors)
+
+    def close(self):
+        """等待全部写完并结束写出线程"""
+        self.wait()
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+def write_output(image, path, fmt=None, writer=None):
+    """给出 writer 时交给后台写出，否则在当前线程写出；返回输出路径"""
+    if writer is not None:
+        writer.submit(image, path, fmt)
+        return path
+    return save_image(image, path, fmt)
@@ -1,8 +1,210 @@
 import os
-from PIL import Image, ImageEnhance, ImageOps
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image, ImageDraw
+from bmp_io import BmpReader, BmpWriter, UnsupportedBmp, read_channel, rgb_to_gray
+from channel_cache import default_cache
+from instrument import add, timed
+from output_writer import DEFAULT_FORMAT, OutputWriter, output_name, save_image, write_output
+from pseudo_color import cached_gray
 
+BLOCK_ROWS = 256  # 分块处理时每块的行数
+
+def load_band(image, band):
+    """
+    读取图片的单个通道为 uint8 二维数组
+
+    参数:
+    image: 图片路径、PIL Image 对象或 numpy 数组
+           （二维数组视为已提取的通道，三维数组按 band 取通道）
+    band: 通道序号，0 为红色，1 为绿色
+    """
+    if isinstance(image, np.ndarray):
+        if image.ndim == 2:
+            return np.asarray(image, dtype=np.uint8)
+        return np.asarray(image[..., band], dtype=np.uint8)
+    # 未压缩BMP直接返回映射文件上的通道视图
+    return read_channel(image, band)
+
+def _blend_lut(degenerate, factor):
+    """按 Image.blend 的单精度计算方式生成 0-255 的查找表"""
+    values = np.arange(256, dtype=np.float32)
+    base = np.float32(degenerate)
+    out = base + np.float32(factor) * (values - base)
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+@timed('pairs')
+def pair_data(red, green):
+    """
+    计算叠加所需的像素组合索引及其直方图
+
+    每个像素的叠加结果只取决于 (红, 绿) 输入值组合，索引为 红<<8|绿。
+    与调节参数无关，可以缓存后在滑块调节时重复使用
+
+    返回:
+    (与输入同形状的 uint16 索引, 长度65536的直方图)
+    """
+    if red.shape != green.shape:
+        raise ValueError("两张图片尺寸不一致")
+    pair_index = red.astype(np.uint16) << 8 | green
+    pair_hist = np.bincount(pair_index.ravel(), minlength=65536)
+    add(pixels=pair_index.size)
+    return pair_index, pair_hist
+
+def scale_lut(alpha):
+    """
+    反相并按透明度缩放的 256 级查找表：min(int((255 - 值) * alpha * 2.5), 255)
+
+    乘法顺序固定为先乘 alpha 再乘 2.5（与预先算出 alpha * 2.5 的浮点结果在部分
+    输入值上差 1），叠加和多通道合成共用此表，结果逐字节一致
+    """
+    levels = np.arange(256)
+    return np.minimum(((255 - levels) * alpha * 2.5).astype(np.int64), 255)
+
+def pair_levels(alpha, threshold):
+    """
+    对 65536 种 (红, 绿) 输入组合计算反相、缩放并去除背景后的值
+
+    返回:
+    (r, g, visible)，均为 (256, 256) 数组，第一维为红色输入值、第二维为绿色输入值
+    """
+    # 反相并按透明度缩放，结果截断到 0-255
+    levels = scale_lut(alpha)
+    r = np.broadcast_to(levels[:, None], (256, 256))
+    g = np.broadcast_to(levels[None, :], (256, 256))
+
+    # 两个通道都低于阈值的像素设为透明（颜色置0）
+    visible = (r >= threshold) | (g >= threshold)
+    return np.where(visible, r, 0), np.where(visible, g, 0), visible
+
+def contrast_mean(pair_hist, r, g, brightness):
+    """
+    由组合直方图求亮度调整后灰度图的均值（即 ImageEnhance.Contrast 使用的均值）
+
+    返回:
+    (均值, 亮度查找表, 各组合亮度调整后的灰度)
+    """
+    bright_lut = _blend_lut(0, brightness)
+    bright_gray = rgb_to_gray(bright_lut[r], bright_lut[g], bright_lut[0])
+    total = max(int(pair_hist.sum()), 1)
+    mean = int(np.dot(pair_hist, bright_gray.ravel()) / total + 0.5)
+    return mean, bright_lut, bright_gray
+
+@timed('enhance')
+def enhance_rgb(rgb, brightness=0.47, contrast=2.4, saturation=2.33, weights=None):
+    """
+    依次做亮度、对比度、饱和度调整，结果与 ImageEnhance 的三个步骤一致
+
+    参数:
+    rgb: (..., 3) 的 uint8 数组
+    weights: 可选，与 rgb 前几维同形状的像素个数。rgb 是颜色组合表而非逐像素
+             图片时，用它计算对比度所需的全图灰度均值
+
+    返回:
+    与 rgb 同形状的 uint8 数组
+    """
+    # 亮度、对比度都是逐通道的查找表；对比度以亮度调整后灰度图的均值为中心
+    bright_lut = _blend_lut(0, brightness)
+    bright = bright_lut[rgb]
+    bright_gray = rgb_to_gray(bright[..., 0], bright[..., 1], bright[..., 2])
+    if weights is None:
+        total = bright_gray.size
+        gray_sum = int(bright_gray.sum(dtype=np.int64))
+    else:
+        weights = np.asarray(weights).reshape(bright_gray.shape)
+        total = int(weights.sum())
+        gray_sum = np.dot(weights.ravel(), bright_gray.ravel())
+    mean = int(gray_sum / max(total, 1) + 0.5)
+    tone = _blend_lut(mean, contrast)[bright]
+
+    # 饱和度以每个像素自身调整后的灰度为基准
+    gray = rgb_to_gray(tone[..., 0], tone[..., 1], tone[..., 2]).astype(np.float32)[..., None]
+    out = gray + np.float32(saturation) * (tone.astype(np.float32) - gray)
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+@timed('overlay')
+def overlay_pairs(pair_index, pair_hist, alpha=0.3, brightness=0.47, contrast=2.4,
+                  saturation=2.33, threshold=30):
+    """
+    由 pair_data 的结果生成叠加图：对 65536 种组合一次性完成反相、缩放、
+    阈值透明以及亮度/对比度/饱和度调整，再按像素索引一次取值
+
+    返回:
+    (高, 宽, 4) 的 uint8 RGBA 数组
+    """
+    return gather_pairs(*overlay_table(pair_hist, alpha, brightness, contrast,
+                                       saturation, threshold), pair_index)
+
+def overlay_table(pair_hist, alpha=0.3, brightness=0.47, contrast=2.4, saturation=2.33,
+                  threshold=30):
+    """
+    按组合直方图生成 65536 种 (红, 绿) 组合的叠加结果
+
+    对比度均值取自整幅图片的直方图，因此同一张表可用于图片的任意局部（瓦片）
+
+    返回:
+    ((256, 256, 3) 的 RGB 表, (256, 256) 的可见性)，用作 gather_pairs 的前两个参数
+    """
+    r, g, visible = pair_levels(alpha, threshold)
+    rgb = np.stack((r, g, np.zeros_like(r)), axis=-1).astype(np.uint8)
+    return enhance_rgb(rgb, brightness, contrast, saturation, pair_hist), visible
+
+@timed('gather')
+def gather_pairs(rgb_table, visible, pair_index):
+    """
+    把 (256, 256, 3) 的组合颜色表和可见性打包成 RGBA，按像素组合索引一次取值
+    """
+    table = np.empty((256, 256, 4), dtype=np.uint8)
+    table[..., :3] = rgb_table
+    table[..., 3] = visible * np.uint8(255)
+    packed = table.reshape(65536, 4).view(np.uint32).ravel()
+    return packed[pair_index].view(np.uint8).reshape(pair_index.shape + (4,))
+
+def overlay_planes(red, green, alpha=0.3, brightness=0.47, contrast=2.4,
+                   saturation=2.33, threshold=30):
+    """
+    叠加核心：对红、绿两个通道平面一次性完成反相、缩放、阈值透明以及
+    亮度/对比度/饱和度调整
+
+    参数:
+    red: 红色通道平面（uint8 二维数组）
+    green: 绿色通道平面（uint8 二维数组）
+    其余参数同 overlay_images
+
+    返回:
+    (高, 宽, 4) 的 uint8 RGBA 数组
+    """
+    pair_index, pair_hist = pair_data(red, green)
+    return overlay_pairs(pair_index, pair_hist, alpha, brightness, contrast,
+                         saturation, threshold)
+
+def overlay_image(image1, image2, alpha=0.3, brightness=0.47, contrast=2.4,
+                  saturation=2.33, threshold=30):
+    """
+    在内存中叠加两张图片，不写文件
+
+    参数:
+    image1: 红色通道图片（路径、PIL Image 或 numpy 数组）
+    image2: 绿色通道图片（路径、PIL Image 或 numpy 数组）
+    其余参数同 overlay_images
+
+    返回:
+    RGBA 模式的 PIL Image
+    """
+    if isinstance(image1, str) and isinstance(image2, str):
+        # 两张都是文件时缓存组合索引，只改调节参数时无需再次读取
+        pairs = default_cache.get_or_create(
+            'pairs', [image1, image2], ('bands',),
+            lambda: pair_data(load_band(image1, 0), load_band(image2, 1)))
+    else:
+        pairs = pair_data(load_band(image1, 0), load_band(image2, 1))
+    rgba = overlay_pairs(*pairs, alpha, brightness, contrast, saturation, threshold)
+    return Image.fromarray(rgba, 'RGBA')
+
+@timed('overlay_images')
 def overlay_images(image1_path, image2_path, output_folder=None, alpha=0.3,
-                  brightness=0.47, contrast=2.4, saturation=2.33, threshold=30):
+                  brightness=0.47, contrast=2.4, saturation=2.33, threshold=30,
+                  block_rows=None, fmt=DEFAULT_FORMAT, writer=None):
     """
     叠加两张图片，在叠加前先进行反相处理
     
@@ -15,69 +217,12 @@ def overlay_images(image1_path, image2_path, output_folder=None, alpha=0.3,
     contrast: 对比度增强系数，默认2.4
     saturation: 色彩饱和度增强系数，默认2.33
     threshold: 背景过滤阈值，默认30
+    block_rows: 给出时按该行数分块处理并逐块写出，内存占用与图片大小无关
+                （仅限未压缩BMP输入和BMP输出，其他格式自动回退到整幅处理）
+    fmt: 输出格式（output_writer.FORMATS），默认 BMP
+    writer: 给出 OutputWriter 时交给后台写出，返回时文件可能尚未写完
     """
     try:
-        # 打开两张图片
-        img1 = Image.open(image1_path)
-        img2 = Image.open(image2_path)
-        
-        # 确保两张图片尺寸相同
-        if img1.size != img2.size:
-            raise ValueError("两张图片尺寸不一致")
-            
-        # 转换为RGBA模式
-        img1 = img1.convert('RGBA')
-        img2 = img2.convert('RGBA')
-        
-        # 创建新图像
-        width, height = img1.size
-        overlay_img = Image.new('RGBA', (width, height))
-        
-        # 对每个像素进行处理
-        for x in range(width):
-            for y in range(height):
-                r1, _, _, _ = img1.getpixel((x, y))
-                _, g2, _, _ = img2.getpixel((x, y))
-                
-                # 在各自通道内进行反相
-                r = 255 - r1  # 红色通道反相
-                g = 255 - g2  # 绿色通道反相
-                
-                # 使用透明度混合
-                r = int(r * alpha * 2.5)
-                g = int(g * alpha * 2.5)
-                
-                # 确保值不超过255
-                r = min(r, 255)
-                g = min(g, 255)
-                
-                # 如果两个通道都低于阈值，则设置为透明
-                if r < threshold and g < threshold:
-                    overlay_img.putpixel((x, y), (0, 0, 0, 0))  # 完全透明
-                else:
-                    overlay_img.putpixel((x, y), (r, g, 0, 255))
-        
-        # 调整亮度和对比度
-        # 由于我们需要保持透明通道，先分离通道
-        r, g, b, a = overlay_img.split()
-        rgb_img = Image.merge('RGB', (r, g, b))
-        
-        # 亮度调整
-        brightness_enhancer = ImageEnhance.Brightness(rgb_img)
-        rgb_img = brightness_enhancer.enhance(brightness)
-        
-        # 对比度调整
-        contrast_enhancer = ImageEnhance.Contrast(rgb_img)
-        rgb_img = contrast_enhancer.enhance(contrast)
-        
-        # 色彩调整
-        color_enhancer = ImageEnhance.Color(rgb_img)
-        rgb_img = color_enhancer.enhance(saturation)
-        
-        # 重新合并透明通道
-        r, g, b = rgb_img.split()
-        overlay_img = Image.merge('RGBA', (r, g, b, a))
-        
         # 准备输出路径
         if output_folder is None:
             output_folder = os.path.dirname(image1_path)
@@ -85,17 +230,200 @@ def overlay_images(image1_path, image2_path, output_folder=None, alpha=0.3,
         # 生成输出文件名
         name1 = os.path.splitext(os.path.basename(image1_path))[0]
         name2 = os.path.splitext(os.path.basename(image2_path))[0]
-        output_path = os.path.join(output_folder, f"{name1}_{name2}_overlay.bmp")
+        output_path = os.path.join(output_folder, output_name(f"{name1}_{name2}_overlay", fmt))
+        
+        if block_rows is not None and fmt == 'bmp':
+            try:
+                overlay_file_blockwise(image1_path, image2_path, output_path, block_rows,
+                                       alpha, brightness, contrast, saturation, threshold)
+                return output_path
+            except UnsupportedBmp:
+                pass
+        
+        overlay_img = overlay_image(image1_path, image2_path, alpha, brightness,
+                                    contrast, saturation, threshold)
         
         # 保存结果
-        overlay_img.save(output_path)
-        return output_path
+        return write_output(overlay_img, output_path, fmt, writer)
         
     except Exception as e:
         print(f"处理图片时出错: {e}")
         return None
 
-def batch_overlay(red_folder, green_folder, output_folder=None):
+@timed('overlay_blockwise')
+def overlay_file_blockwise(image1_path, image2_path, output_path, block_rows=BLOCK_ROWS,
+                           alpha=0.3, brightness=0.47, contrast=2.4, saturation=2.33,
+                           threshold=30):
+    """
+    分块叠加两张未压缩BMP并逐块写出，结果与 overlay_image 保存的文件相同
+
+    对比度调整需要整幅图片的均值，因此先按块统计组合直方图，再按块查表取值
+    并写出。任意时刻只保留 block_rows 行的数据，可处理大于内存的图片。
+    格式不支持时抛出 UnsupportedBmp
+
+    参数:
+    image1_path: 红色通道图片路径
+    image2_path: 绿色通道图片路径
+    output_path: 输出路径（32位BMP）
+    block_rows: 每块的行数
+    """
+    red_reader = BmpReader(image1_path)
+    green_reader = BmpReader(image2_path)
+    if red_reader.size != green_reader.size:
+        raise ValueError("两张图片尺寸不一致")
+    width, height = red_reader.size
+
+    def pair_blocks():
+        # read_rows 按自下而上的顺序返回 BGR 行，红色为第2分量，绿色为第1分量
+        for start in range(0, height, block_rows):
+            red = red_reader.read_rows(start, block_rows)[..., 2]
+            green = green_reader.read_rows(start, block_rows)[..., 1]
+            yield red.astype(np.uint16) << 8 | green
+
+    # 第一遍：组合直方图
+    pair_hist = np.zeros(65536, dtype=np.int64)
+    for pair_index in pair_blocks():
+        pair_hist += np.bincount(pair_index.ravel(), minlength=65536)
+    table = overlay_table(pair_hist, alpha, brightness, contrast, saturation, threshold)
+
+    # 第二遍：查表并逐块写出
+    with BmpWriter(output_path, width, height, bpp=32) as writer:
+        for pair_index in pair_blocks():
+            rgba = gather_pairs(*table, pair_index)
+            writer.write_rows(rgba[..., [2, 1, 0, 3]])
+    add(pixels=width * height, bytes_written=os.path.getsize(output_path))
+
+def render_matrix(red_planes, green_planes, output_folder, pairs=None, max_workers=None,
+                  thumbnail_size=(200, 200), fmt=DEFAULT_FORMAT, **params):
+    """
+    对已解码的通道平面批量叠加，每个平面只解码一次，所有组合在线程池中并行计算
+
+    参数:
+    red_planes: {输出名: 红色通道平面}
+    green_planes: {输出名: 绿色通道平面}
+    output_folder: 输出文件夹路径
+    pairs: 需要计算的 (红色名, 绿色名) 列表，None 表示全部组合
+    max_workers: 并行数，None 表示按CPU核数
+    thumbnail_size: 缩略图总览中每格的尺寸
+    fmt: 叠加图的输出格式（总览图总是 BMP）
+    params: 传给 overlay_pairs 的调节参数
+
+    返回:
+    dict: {(红色名, 绿色名): 输出路径，失败为None}
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    if pairs is None:
+        pairs = [(r, g) for r in red_planes for g in green_planes]
+
+    # 红色通道的高8位索引每张只算一次，各组合只需与绿色通道按位或
+    red_high = {name: red_planes[name].astype(np.uint16) << 8
+                for name in set(r for r, _ in pairs)}
+
+    def render(pair):
+        red_name, green_name = pair
+        try:
+            green = green_planes[green_name]
+            if green.shape != red_high[red_name].shape:
+                raise ValueError("两张图片尺寸不一致")
+            pair_index = red_high[red_name] | green
+            pair_hist = np.bincount(pair_index.ravel(), minlength=65536)
+            rgba = overlay_pairs(pair_index, pair_hist, **params)
+            overlay_img = Image.fromarray(rgba, 'RGBA')
+            output_path = os.path.join(output_folder,
+                                       output_name(f"{red_name}_{green_name}_overlay", fmt))
+            # 写出排队期间 overlay_img 不能再修改，缩略图从副本生成
+            thumbnail = overlay_img.copy()
+            thumbnail.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
+            writer.submit(overlay_img, output_path, fmt)
+            return output_path, thumbnail
+        except Exception as e:
+            print(f"处理图片 {red_name} + {green_name} 时出错: {e}")
+            return None, None
+
+    # 计算线程只负责叠加，编码和写文件交给写出线程
+    with OutputWriter() as writer:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            rendered = dict(zip(pairs, pool.map(render, pairs)))
+
+        sheet = contact_sheet({pair: thumb for pair, (_, thumb) in rendered.items()},
+                              list(red_planes), list(green_planes), thumbnail_size)
+        sheet_path = os.path.join(output_folder, "overlay_matrix.bmp")
+        save_image(sheet, sheet_path)
+        print(f"已生成叠加总览: {sheet_path}")
+    failed = set(path for path, _ in writer.errors)
+    return {pair: path if path not in failed else None for pair, (path, _) in rendered.items()}
+
+def contact_sheet(thumbnails, red_names, green_names, cell_size=(200, 200), label_size=120):
+    """
+    把叠加缩略图排成 红色(行) x 绿色(列) 的总览图
+
+    参数:
+    thumbnails: {(红色名, 绿色名): 缩略图}，缺少的组合留空
+    red_names: 行标题
+    green_names: 列标题
+    """
+    cell_w, cell_h = cell_size
+    sheet = Image.new('RGB', (label_size + cell_w * len(green_names),
+                              20 + cell_h * len(red_names)), (32, 32, 32))
+    draw = ImageDraw.Draw(sheet)
+    for col, green_name in enumerate(green_names):
+        draw.text((label_size + col * cell_w + 4, 4), green_name, fill=(0, 255, 0))
+    for row, red_name in enumerate(red_names):
+        y = 20 + row * cell_h
+        draw.text((4, y + cell_h // 2), red_name, fill=(255, 0, 0))
+        for col, green_name in enumerate(green_names):
+            thumb = thumbnails.get((red_name, green_name))
+            if thumb is not None:
+                # 透明背景以深灰显示
+                sheet.paste(thumb, (label_size + col * cell_w, y), thumb)
+    return sheet
+
+def overlay_matrix(combined_folder, output_folder=None, names=None, pairs=None,
+                   max_workers=None, fmt=DEFAULT_FORMAT, **params):
+    """
+    对combined文件夹中的合并图计算全部 红x绿 组合的叠加图
+
+    每张图片只解码一次得到灰度平面，同时用作红色和绿色通道；结果与GUI中
+    选择对应红/绿通道后导出的叠加图相同，并额外生成 overlay_matrix.bmp 总览
+
+    参数:
+    combined_folder: 合并图所在文件夹
+    output_folder: 输出文件夹，默认为 combined_folder 下的 overlay
+    names: 参与的合并图文件名列表，None 表示全部
+    pairs: 需要计算的 (红色文件名, 绿色文件名) 列表，None 表示全部组合
+    其余参数同 render_matrix
+
+    返回:
+    int: 成功处理的组合数
+    """
+    try:
+        if output_folder is None:
+            output_folder = os.path.join(combined_folder, "overlay")
+        if names is None:
+            # 与GUI下拉框相同的过滤规则
+            names = sorted(f for f in os.listdir(combined_folder)
+                           if f.endswith('.bmp') and 'overlay' not in f
+                           and '_green' not in f and '_red' not in f)
+
+        planes = {name: cached_gray(os.path.join(combined_folder, name)) for name in names}
+        stems = {name: os.path.splitext(name)[0] for name in names}
+        red_planes = {f"{stems[n]}_red": planes[n] for n in names}
+        green_planes = {f"{stems[n]}_green": planes[n] for n in names}
+        if pairs is not None:
+            pairs = [(f"{stems[r]}_red", f"{stems[g]}_green") for r, g in pairs]
+
+        results = render_matrix(red_planes, green_planes, output_folder, pairs,
+                                max_workers, fmt=fmt, **params)
+        processed_count = sum(1 for path in results.values() if path)
+        print(f"矩阵叠加完成，共处理 {processed_count} 对图片")
+        return processed_count
+
+    except Exception as e:
+        print(f"矩阵叠加时出错: {e}")
+        return 0
+
+def batch_overlay(red_folder, green_folder, output_folder=None, matrix=False,
+                  max_workers=None, block_rows=None, fmt=DEFAULT_FORMAT):
     """
     批量处理文件夹中的图片对
     
@@ -103,6 +431,12 @@ def batch_overlay(red_folder, green_folder, output_folder=None):
     red_folder: 红色通道图片文件夹
     green_folder: 绿色通道图片文件夹
     output_folder: 输出文件夹路径
+    matrix: True 时叠加所有 红x绿 组合（每张图片只解码一次，并行计算并生成总览），
+            False 时只叠加同名的图片对
+    max_workers: 矩阵模式的并行数
+    block_rows: 同 overlay_images，只用于同名图片对模式
+    fmt: 叠加图的输出格式；编码和写文件在后台写出线程中进行，
+         计算下一对时前面的结果仍在写出
     """
     try:
         # 检查输入文件夹是否存在
@@ -113,6 +447,7 @@ def batch_overlay(red_folder, green_folder, output_folder=None):
             
         if output_folder is None:
             output_folder = os.path.join(os.path.dirname(red_folder), "overlay")
+        os.makedirs(output_folder, exist_ok=True)
         
         # 获取所有图片文件名
         red_files = {os.path.splitext(f)[0].replace('_red', ''): f 
@@ -120,19 +455,33 @@ def batch_overlay(red_folder, green_folder, output_folder=None):
         green_files = {os.path.splitext(f)[0].replace('_green', ''): f 
                       for f in os.listdir(green_folder) if f.endswith('.bmp')}
         
+        if matrix:
+            red_planes = {os.path.splitext(f)[0]: np.array(load_band(os.path.join(red_folder, f), 0))
+                          for f in red_files.values()}
+            green_planes = {os.path.splitext(f)[0]: np.array(load_band(os.path.join(green_folder, f), 1))
+                            for f in green_files.values()}
+            results = render_matrix(red_planes, green_planes, output_folder,
+                                    max_workers=max_workers, fmt=fmt)
+            processed_count = sum(1 for path in results.values() if path)
+            print(f"批量叠加完成，共处理 {processed_count} 对图片")
+            return processed_count
+        
         # 找到共同的基础文件名
         common_files = set(red_files.keys()) & set(green_files.keys())
         
         processed_count = 0
-        for base_name in common_files:
-            red_path = os.path.join(red_folder, red_files[base_name])
-            green_path = os.path.join(green_folder, green_files[base_name])
-            if overlay_images(red_path, green_path, output_folder):
-                processed_count += 1
+        with OutputWriter() as writer:
+            for base_name in common_files:
+                red_path = os.path.join(red_folder, red_files[base_name])
+                green_path = os.path.join(green_folder, green_files[base_name])
+                if overlay_images(red_path, green_path, output_folder, block_rows=block_rows,
+                                  fmt=fmt, writer=writer):
+                    processed_count += 1
+        processed_count -= len(writer.errors)
         
         print(f"批量叠加完成，共处理 {processed_count} 对图片")
         return processed_count
         
     except Exception as e:
         print(f"批量处理时出错: {e}")
-        return 0
\ No newline at end of file
+        return 0
@@ -0,0 +1,181 @@
+import argparse
+import os
+import numpy as np
+from PIL import Image
+from bmp_io import UnsupportedBmp
+from merge import QUADRANTS, get_prefix, stitch_gray, stitch_in_memory, stitch_streaming
+from output_writer import DEFAULT_FORMAT, FORMATS, OutputWriter, output_name, write_output
+from overlay import overlay_planes
+from pseudo_color import pseudo_color_image
+
+OUTPUT_KINDS = ('combined', 'pseudo', 'overlay')
+
+def load_set_gray(prefix, folder_path, combined_path=None):
+    """
+    读取一组四张图片并返回合并后的灰度平面，每个源文件只读一次
+
+    参数:
+    prefix: 图片前缀
+    folder_path: 源文件夹路径
+    combined_path: 给出时同时写出合并后的RGB图片
+
+    返回:
+    (2*高, 2*宽) 的 uint8 数组
+    """
+    paths = {q: os.path.join(folder_path, f"{prefix}_{q}.bmp") for q in QUADRANTS}
+    if combined_path is None:
+        return stitch_gray(paths)
+    try:
+        lu_width, lu_height = Image.open(paths["LU"]).size
+        gray = np.empty((lu_height * 2, lu_width * 2), dtype=np.uint8)
+        stitch_streaming(paths, combined_path, gray_out=gray)
+        return gray
+    except UnsupportedBmp:
+        gray = stitch_gray(paths)
+        stitch_in_memory(paths, combined_path)
+        return gray
+
+def render_pair(red_prefix, green_prefix, folder_path, output_folder=None,
+                outputs=('overlay',), grays=None, fmt=DEFAULT_FORMAT, writer=None, **params):
+    """
+    从四张原始图片直接生成叠加图，中间只在内存中保留灰度平面
+
+    相当于依次执行 merge.process_image_set、convert_to_pseudo_color 和
+    overlay_images，输出文件名也与它们一致，但只写出 outputs 中要求的文件
+
+    参数:
+    red_prefix: 红色通道图片组前缀
+    green_prefix: 绿色通道图片组前缀
+    folder_path: 源文件夹路径
+    output_folder: 输出文件夹路径，默认为源文件夹下的combined
+    outputs: 需要写出的结果，取自 'combined'、'pseudo'、'overlay'
+    grays: 可选的 {前缀: 灰度平面} 字典，批量处理时复用已读取的图片组
+    fmt: 伪彩图和叠加图的输出格式（合并图总是 BMP，供后续按行读取）
+    writer: 给出 OutputWriter 时伪彩图和叠加图交给后台写出
+    params: 传给 overlay_planes 的调节参数
+
+    返回:
+    dict: {结果类型: [输出路径]}，出错时返回None
+    """
+    try:
+        if output_folder is None:
+            output_folder = os.path.join(folder_path, "combined")
+        os.makedirs(output_folder, exist_ok=True)
+        if grays is None:
+            grays = {}
+
+        written = {kind: [] for kind in outputs}
+        planes = {}
+        for prefix in (red_prefix, green_prefix):
+            if prefix not in grays:
+                combined_path = None
+                if 'combined' in outputs:
+                    combined_path = os.path.join(output_folder, f"{prefix}_combined.bmp")
+                    written['combined'].append(combined_path)
+                grays[prefix] = load_set_gray(prefix, folder_path, combined_path)
+            planes[prefix] = grays[prefix]
+
+        red_name = f"{red_prefix}_combined_red"
+        green_name = f"{green_prefix}_combined_green"
+        if 'pseudo' in outputs:
+            for name, prefix, mode in ((red_name, red_prefix, 'red'),
+                                       (green_name, green_prefix, 'green')):
+                path = os.path.join(output_folder, output_name(name, fmt))
+                write_output(pseudo_color_image(planes[prefix], mode), path, fmt, writer)
+                written['pseudo'].append(path)
+
+        if 'overlay' in outputs:
+            rgba = overlay_planes(planes[red_prefix], planes[green_prefix], **params)
+            path = os.path.join(output_folder, output_name(f"{red_name}_{green_name}_overlay", fmt))
+            write_output(Image.fromarray(rgba, 'RGBA'), path, fmt, writer)
+            written['overlay'].append(path)
+
+        print(f"已处理: {red_prefix} + {green_prefix}")
+        return written
+
+    except Exception as e:
+        print(f"处理图片组 {red_prefix} + {green_prefix} 时出错: {e}")
+        return None
+
+def find_pairs(folder_path, red_type, green_type):
+    """
+    按文件名中的碱基类型配对图片组
+
+    前缀形如 <类型>_<其余部分>（与GUI中的通道信息解析方式一致），
+    其余部分相同的红色类型组和绿色类型组配成一对
+
+    返回:
+    [(红色前缀, 绿色前缀)]
+    """
+    files = set(f for f in os.listdir(folder_path) if f.endswith('.bmp'))
+    complete = sorted(p for p in set(get_prefix(f) for f in files)
+                      if all(f"{p}_{q}.bmp" in files for q in QUADRANTS))
+
+    def by_rest(base_type):
+        groups = {}
+        for prefix in complete:
+            head, _, rest = prefix.partition('_')
+            if head == base_type:
+                groups[rest] = prefix
+        return groups
+
+    red_sets = by_rest(red_type)
+    green_sets = by_rest(green_type)
+    return [(red_sets[rest], green_sets[rest]) for rest in sorted(red_sets)
+            if rest in green_sets]
+
+def render_folder(folder_path, red_type, green_type, output_folder=None,
+                  outputs=('overlay',), fmt=DEFAULT_FORMAT, **params):
+    """
+    对整个文件夹执行融合流程
+
+    结果在后台写出线程中编码和写入，计算下一对时前面的结果仍在写出
+
+    返回:
+    int: 成功处理的图片对数
+    """
+    pairs = find_pairs(folder_path, red_type, green_type)
+    processed_count = 0
+    with OutputWriter() as writer:
+        for red_prefix, green_prefix in pairs:
+            # 每对各自读取，处理完即释放灰度平面
+            if render_pair(red_prefix, green_prefix, folder_path, output_folder,
+                           outputs, fmt=fmt, writer=writer, **params) is not None:
+                processed_count += 1
+    if writer.errors:
+        print(f"{len(writer.errors)} 个文件写出失败")
+    print(f"批量处理完成，共处理 {processed_count}/{len(pairs)} 对图片")
+    return processed_count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="从四张原始图片直接生成叠加图（无界面批处理）")
+    parser.add_argument("folder", help="包含 _LD/_LU/_RD/_RU 图片的文件夹")
+    parser.add_argument("--red", required=True, help="红色通道碱基类型，如 A")
+    parser.add_argument("--green", required=True, help="绿色通道碱基类型，如 C")
+    parser.add_argument("--output", default=None, help="输出文件夹，默认 <folder>/combined")
+    parser.add_argument("--save", default="overlay",
+                        help="需要写出的结果，逗号分隔：combined,pseudo,overlay")
+    parser.add_argument("--format", default=DEFAULT_FORMAT, choices=list(FORMATS),
+                        help="伪彩图和叠加图的输出格式，默认 bmp")
+    parser.add_argument("--alpha", type=float, default=0.3)
+    parser.add_argument("--brightness", type=float, default=0.47)
+    parser.add_argument("--contrast", type=float, default=2.4)
+    parser.add_argument("--saturation", type=float, default=2.33)
+    parser.add_argument("--threshold", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    outputs = tuple(kind.strip() for kind in args.save.split(',') if kind.strip())
+    unknown = [kind for kind in outputs if kind not in OUTPUT_KINDS]
+    if unknown:
+        parser.error(f"未知的输出类型: {', '.join(unknown)}")
+
+    processed_count = render_folder(
+        args.folder, args.red, args.green, args.output, outputs, fmt=args.format,
+        alpha=args.alpha, brightness=args.brightness, contrast=args.contrast,
+        saturation=args.saturation, threshold=args.threshold)
+    return 0 if processed_count else 1
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
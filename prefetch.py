@@ -0,0 +1,92 @@
+import os
+import time
+from render_worker import RenderWorker
+
+DEFAULT_BUDGET = 128 * 1024 * 1024  # 每轮预取的数据总量上限
+DEFAULT_RADIUS = 2                   # 预取当前选择前后各几项
+
+class Prefetcher:
+    """
+    预取下拉框中相邻的图片
+
+    操作员通常按顺序逐项切换红/绿通道的下拉框。每次选择后在后台依次生成
+    前后相邻项的代理平面和叠加组合索引（放入共享缓存），切换到下一项时预览
+    直接命中缓存。预取是低优先级的：等待 idle_delay_ms 毫秒后才开始，
+    busy() 为真（前台正在渲染或合并）时暂停；每轮预取的数据总量不超过 budget 字节，
+    避免把当前选择的数据挤出缓存。新的选择或切换文件夹时取消尚未完成的预取
+    """
+
+    def __init__(self, root, proxy_cache, busy=None, budget=DEFAULT_BUDGET,
+                 radius=DEFAULT_RADIUS, idle_delay_ms=300):
+        self.proxy_cache = proxy_cache
+        self.busy = busy or (lambda: False)
+        self.budget = budget
+        self.radius = radius
+        self.worker = RenderWorker(root, debounce_ms=idle_delay_ms)
+
+    def plan(self, folder, red_files, red_index, green_files, green_index):
+        """
+        按预计被选中的先后顺序列出要预取的项
+
+        先后一项、再前一项，依次向外；每个位置包括：红色通道换成相邻项、
+        绿色通道换成相邻项，以及两者同时换成相邻项（逐组查看时）
+
+        返回:
+        list: [('proxy', 路径) 或 ('pairs', 红色路径, 绿色路径)]
+        """
+        def neighbour(files, index, step):
+            if index < 0 or not 0 <= index + step < len(files):
+                return None
+            return os.path.join(folder, files[index + step])
+
+        red = os.path.join(folder, red_files[red_index]) if red_index >= 0 else None
+        green = os.path.join(folder, green_files[green_index]) if green_index >= 0 else None
+        items = []
+        for distance in range(1, self.radius + 1):
+            for step in (distance, -distance):
+                next_red = neighbour(red_files, red_index, step)
+                next_green = neighbour(green_files, green_index, step)
+                if next_red:
+                    items.append(('proxy', next_red))
+                    if green:
+                        items.append(('pairs', next_red, green))
+                if next_green:
+                    items.append(('proxy', next_green))
+                    if red:
+                        items.append(('pairs', red, next_green))
+                if next_red and next_green:
+                    items.append(('pairs', next_red, next_green))
+        # 去掉重复项（两个下拉框的列表相同时相邻项会重复）
+        return list(dict.fromkeys(items))
+
+    def prefetch(self, folder, red_files, red_index, green_files, green_index):
+        """取消上一轮预取，开始为当前选择预取相邻项（在界面线程调用）"""
+        items = self.plan(folder, red_files, red_index, green_files, green_index)
+        if not items:
+            self.worker.cancel()
+            return
+        self.worker.submit(lambda job: self._run(job, items))
+
+    def cancel(self):
+        """取消预取（切换文件夹时调用）"""
+        self.worker.cancel()
+
+    def _run(self, job, items):
+        used = 0
+        for item in items:
+            # 前台有任务时让出 CPU 和磁盘
+            while self.busy():
+                job.check()
+                time.sleep(0.05)
+            job.check()
+            if used >= self.budget:
+                break
+            try:
+                if item[0] == 'proxy':
+                    value = self.proxy_cache.get(item[1])
+                    used += value.nbytes
+                else:
+                    used += sum(part.nbytes for part in self.proxy_cache.pairs(*item[1:]))
+            except Exception as e:
+                # 预取失败（如文件正在写入）不影响前台，选中时再按正常流程报错
+                print(f"预取 {item[1:]} 时出错: {e}")
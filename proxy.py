@@ -0,0 +1,73 @@
+import numpy as np
+from PIL import Image
+from bmp_io import read_gray
+from channel_cache import default_cache
+from instrument import add, timed
+from overlay import pair_data
+
+def pyramid_factor(image_size, target_size):
+    """
+    计算金字塔层级的缩小倍数
+
+    返回不超过 原图/目标 比例的最大2的幂，保证该层级缩略后仍能填满预览区域
+
+    参数:
+    image_size: 原图尺寸 (宽, 高)
+    target_size: 预览区域尺寸 (宽, 高)
+    """
+    width, height = image_size
+    ratio = max(width / target_size[0], height / target_size[1])
+    factor = 1
+    while factor * 2 <= ratio:
+        factor *= 2
+    return factor
+
+@timed('proxy')
+def pyramid_level(image, target_size):
+    """
+    生成与预览尺寸匹配的灰度金字塔层级
+
+    参数:
+    image: 图片路径或 PIL Image 对象
+    target_size: 预览区域尺寸 (宽, 高)
+
+    返回:
+    (灰度图层级, 缩小倍数)
+    """
+    if isinstance(image, Image.Image):
+        gray_img = image.convert('L')
+    else:
+        gray_img = Image.fromarray(read_gray(image))
+    add(pixels=gray_img.width * gray_img.height)
+    factor = pyramid_factor(gray_img.size, target_size)
+    if factor > 1:
+        # reduce 为盒式滤波，一次完成 factor 倍缩小
+        gray_img = gray_img.reduce(factor)
+    return gray_img, factor
+
+class ProxyCache:
+    """
+    预览用金字塔层级的缓存，滑块调节时只在该层级上计算
+
+    数据存放在共享的 ChannelCache 中，文件修改时间变化时自动重建
+    """
+
+    def __init__(self, target_size, cache=default_cache):
+        self.target_size = target_size
+        self.cache = cache
+
+    def get(self, image_path):
+        """返回 image_path 对应的灰度代理平面（只读 uint8 数组）"""
+        return self.cache.get_or_create(
+            'proxy', [image_path], tuple(self.target_size),
+            lambda: np.asarray(pyramid_level(image_path, self.target_size)[0]))
+
+    def pairs(self, red_path, green_path):
+        """返回两张图片代理平面的叠加组合索引及其直方图（经缓存）"""
+        return self.cache.get_or_create(
+            'pairs', [red_path, green_path], ('gray', tuple(self.target_size)),
+            lambda: pair_data(self.get(red_path), self.get(green_path)))
+
+    def clear(self):
+        """清空缓存（切换文件夹时调用）"""
+        self.cache.clear()
@@ -1,7 +1,61 @@
 import os
+import numpy as np
 from PIL import Image
+from bmp_io import BmpReader, BmpWriter, UnsupportedBmp, read_gray, rgb_to_gray
+from channel_cache import default_cache
+from instrument import add, stage, timed
+from output_writer import FORMATS, OutputWriter, write_output
 
-def convert_to_pseudo_color(image_path, color_mode='red', output_folder=None):
+BLOCK_ROWS = 256  # 分块处理时每块的行数
+
+def cached_gray(image_path):
+    """
+    读取图片的灰度平面，结果按路径和修改时间缓存（只读数组）
+
+    缓存的是内存中的副本，不会一直占用映射的文件
+    """
+    return default_cache.get_or_create(
+        'gray', [image_path], (), lambda: decode_gray(image_path))
+
+def decode_gray(image_path):
+    """解码图片的灰度平面（计入 decode 阶段）"""
+    with stage('decode') as s:
+        gray = np.array(read_gray(image_path))
+        s.add(bytes_read=os.path.getsize(image_path), pixels=gray.size)
+    return gray
+
+@timed('pseudo_color')
+def pseudo_color_image(image, color_mode='red'):
+    """
+    在内存中生成伪彩色图片，不写文件
+
+    参数:
+    image: 输入图片（PIL Image 对象、图片路径或 uint8 灰度数组）
+    color_mode: 'red' 或 'green'，选择伪彩色模式
+
+    返回:
+    RGB 模式的 PIL Image，灰度值放入所选通道，其余通道为0
+    """
+    if isinstance(image, Image.Image):
+        gray_img = image.convert('L')
+    elif isinstance(image, np.ndarray):
+        gray_img = Image.fromarray(image)
+    else:
+        # 未压缩BMP从映射文件直接取灰度，不经过 PIL 解码，并缓存供再次使用
+        gray_img = Image.fromarray(cached_gray(image))
+
+    # 整幅图按通道合并，代替逐像素 getpixel/putpixel
+    zero = Image.new('L', gray_img.size, 0)
+    if color_mode == 'red':
+        bands = (gray_img, zero, zero)
+    else:  # green
+        bands = (zero, gray_img, zero)
+    add(pixels=gray_img.width * gray_img.height)
+    return Image.merge('RGB', bands)
+
+@timed('convert_to_pseudo_color')
+def convert_to_pseudo_color(image_path, color_mode='red', output_folder=None,
+                            block_rows=None, fmt=None, writer=None):
     """
     将图片转换为伪彩色图片
     
@@ -9,25 +63,12 @@ def convert_to_pseudo_color(image_path, color_mode='red', output_folder=None):
     image_path: 输入图片路径
     color_mode: 'red' 或 'green'，选择伪彩色模式
     output_folder: 输出文件夹路径，如果为None则使用源文件夹
+    block_rows: 给出时按该行数分块处理并逐块写出，内存占用与图片大小无关
+                （仅限未压缩BMP输入和输出，其他格式自动回退到整幅处理）
+    fmt: 输出格式（output_writer.FORMATS），None 表示与输入图片相同
+    writer: 给出 OutputWriter 时交给后台写出，返回时文件可能尚未写完
     """
     try:
-        # 打开图片并转换为灰度图
-        img = Image.open(image_path)
-        gray_img = img.convert('L')
-        
-        # 创建新的RGB图像
-        pseudo_img = Image.new('RGB', gray_img.size)
-        width, height = gray_img.size
-        
-        # 逐像素处理
-        for x in range(width):
-            for y in range(height):
-                gray_value = gray_img.getpixel((x, y))
-                if color_mode == 'red':
-                    pseudo_img.putpixel((x, y), (gray_value, 0, 0))
-                else:  # green
-                    pseudo_img.putpixel((x, y), (0, gray_value, 0))
-        
         # 准备输出路径
         if output_folder is None:
             output_folder = os.path.dirname(image_path)
@@ -37,10 +78,22 @@ def convert_to_pseudo_color(image_path, color_mode='red', output_folder=None):
         # 生成输出文件名
         filename = os.path.basename(image_path)
         name, ext = os.path.splitext(filename)
+        if fmt is not None:
+            ext = FORMATS[fmt][0]
         output_path = os.path.join(output_folder, f"{name}_{color_mode}{ext}")
         
+        if block_rows is not None and ext.lower() == '.bmp':
+            try:
+                pseudo_color_file_blockwise(image_path, output_path, color_mode, block_rows)
+                print(f"已生成伪彩色图片: {output_path}")
+                return output_path
+            except UnsupportedBmp:
+                pass
+        
+        pseudo_img = pseudo_color_image(image_path, color_mode)
+        
         # 保存结果
-        pseudo_img.save(output_path)
+        write_output(pseudo_img, output_path, fmt, writer)
         print(f"已生成伪彩色图片: {output_path}")
         return output_path
         
@@ -48,14 +101,38 @@ def convert_to_pseudo_color(image_path, color_mode='red', output_folder=None):
         print(f"处理图片时出错: {e}")
         return None
 
-def batch_process(input_folder, color_mode='red', output_folder=None):
+@timed('pseudo_color_blockwise')
+def pseudo_color_file_blockwise(image_path, output_path, color_mode='red',
+                                block_rows=BLOCK_ROWS):
+    """
+    分块生成未压缩BMP的伪彩图并逐块写出，结果与 pseudo_color_image 保存的文件相同
+
+    任意时刻只保留 block_rows 行的数据；格式不支持时抛出 UnsupportedBmp
+    """
+    reader = BmpReader(image_path)
+    width, height = reader.size
+    band = 2 if color_mode == 'red' else 1  # BGR 中的位置
+    with BmpWriter(output_path, width, height) as writer:
+        for start in range(0, height, block_rows):
+            bgr = reader.read_rows(start, block_rows)
+            out = np.zeros(bgr.shape[:2] + (3,), dtype=np.uint8)
+            out[..., band] = rgb_to_gray(bgr[..., 2], bgr[..., 1], bgr[..., 0])
+            writer.write_rows(out)
+    add(pixels=width * height, bytes_written=os.path.getsize(output_path))
+
+def batch_process(input_folder, color_mode='red', output_folder=None, block_rows=None,
+                  fmt=None):
     """
     批量处理文件夹中的所有图片
+
+    编码和写文件在后台写出线程中进行，计算下一张时前面的结果仍在写出
     
     参数:
     input_folder: 输入文件夹路径
     color_mode: 'red' 或 'green'，选择伪彩色模式
     output_folder: 输出文件夹路径
+    block_rows: 同 convert_to_pseudo_color
+    fmt: 同 convert_to_pseudo_color
     """
     if output_folder is None:
         output_folder = os.path.join(input_folder, f"{color_mode}_pseudo")
@@ -66,11 +143,14 @@ def batch_process(input_folder, color_mode='red', output_folder=None):
     
     # 处理所有图片
     processed_count = 0
-    for filename in os.listdir(input_folder):
-        if filename.lower().endswith(('.bmp', '.jpg', '.png')):
-            image_path = os.path.join(input_folder, filename)
-            if convert_to_pseudo_color(image_path, color_mode, output_folder):
-                processed_count += 1
+    with OutputWriter() as writer:
+        for filename in os.listdir(input_folder):
+            if filename.lower().endswith(('.bmp', '.jpg', '.png')):
+                image_path = os.path.join(input_folder, filename)
+                if convert_to_pseudo_color(image_path, color_mode, output_folder, block_rows,
+                                           fmt, writer):
+                    processed_count += 1
+    processed_count -= len(writer.errors)
     
     print(f"批量处理完成，共处理 {processed_count} 张图片")
 
@@ -0,0 +1,323 @@
+import json
+import os
+import numpy as np
+from PIL import Image
+from bmp_io import BmpReader, BmpWriter, UnsupportedBmp, read_gray, temp_path
+from instrument import timed
+
+REGISTRATION_NAME = "registration.json"
+MAX_OVERLAP = 0.1    # 相邻两张图片重叠部分最多占边长的比例
+MAX_STRIP = 256      # 重叠条带的最大宽度（像素）
+MAX_LENGTH = 1024    # 条带沿接缝方向只取中间这么长的一段
+MIN_CORRELATION = 0.5  # 重叠部分的相关系数低于该值视为没有可靠的重叠，按名义位置摆放
+STRIP_ROWS = 256
+
+# 相邻的四对图片：(参照图, 相邻图, 方向)，h 为左右相邻，v 为上下相邻
+NEIGHBOURS = (("LU", "RU", "h"), ("LD", "RD", "h"), ("LU", "LD", "v"), ("RU", "RD", "v"))
+
+class QuadrantSource:
+    """按显示顺序（从上到下）读取一张象限图片的行和灰度区域"""
+
+    def __init__(self, path):
+        try:
+            self.reader = BmpReader(path)
+            self.size = self.reader.size
+            self.pixels = None
+        except UnsupportedBmp:
+            # 不能映射的格式整幅解码
+            self.reader = None
+            self.pixels = np.asarray(Image.open(path).convert('RGB'))[..., ::-1]
+            self.size = (self.pixels.shape[1], self.pixels.shape[0])
+        self.path = path
+        self._gray = None
+
+    def rows(self, start, stop):
+        """返回第 start 到 stop 行（从上到下）的 (行数, 宽, 3) BGR 数组"""
+        if self.reader is None:
+            return self.pixels[start:stop]
+        height = self.size[1]
+        return self.reader.read_rows(height - stop, stop - start)[::-1]
+
+    def gray_region(self, x, y, width, height):
+        """返回一块区域的灰度（同 BmpReader.gray_region）"""
+        if self.reader is None:
+            if self._gray is None:
+                self._gray = read_gray(self.path)
+            return self._gray[y:y + height, x:x + width]
+        return self.reader.gray_region(x, y, width, height)
+
+def fft_size(n):
+    """不小于 n、只含因子 2、3、5 的最小长度"""
+    while True:
+        m = n
+        for factor in (2, 3, 5):
+            while m % factor == 0:
+                m //= factor
+        if m == 1:
+            return n
+        n += 1
+
+def phase_correlation(a, b, search):
+    """
+    批量相位相关
+
+    汉宁窗只沿第二维（接缝方向）施加：重叠带位于条带垂直于接缝方向的边缘，
+    在该方向加窗会把窄的重叠带压没
+
+    参数:
+    a, b: (批, 高, 宽) 的数组，第一维垂直于接缝
+    search: ((dy最小, dy最大), (dx最小, dx最大))，只在该范围内找相关峰
+
+    返回:
+    (偏移, 置信度)：偏移为 (批, 2) 的亚像素 (dy, dx)，满足 b(p) ≈ a(p + 偏移)；
+    置信度为相关峰高出整张相关图均值的标准差倍数
+    """
+    count, height, width = a.shape
+    window = np.hanning(width).astype(np.float32)
+    a = (a - a.mean(axis=(1, 2), keepdims=True)) * window
+    b = (b - b.mean(axis=(1, 2), keepdims=True)) * window
+    # 补零到能容纳搜索范围的大小，正负方向的偏移不会因循环相关而混淆；
+    # 取只含因子 2、3、5 的长度，FFT 更快
+    shape = tuple(fft_size(n + max(abs(low), abs(high)))
+                  for n, (low, high) in zip((height, width), search))
+    spectrum = np.fft.rfft2(a, s=shape) * np.conj(np.fft.rfft2(b, s=shape))
+    spectrum /= np.abs(spectrum) + 1e-9
+    corr = np.fft.irfft2(spectrum, s=shape)
+
+    dys = np.arange(search[0][0], search[0][1] + 1)
+    dxs = np.arange(search[1][0], search[1][1] + 1)
+    region = corr[:, dys[:, None] % shape[0], dxs[None, :] % shape[1]]
+    iy, ix = np.unravel_index(region.reshape(count, -1).argmax(axis=1), region.shape[1:])
+    batch = np.arange(count)
+    peak = region[batch, iy, ix]
+    score = (peak - corr.mean(axis=(1, 2))) / corr.std(axis=(1, 2))
+
+    py = dys[iy] % shape[0]
+    px = dxs[ix] % shape[1]
+
+    def refine(minus, plus):
+        # 抛物线拟合峰值两侧，得到亚像素位置
+        denom = minus - 2 * peak + plus
+        return np.where(np.abs(denom) > 1e-12, 0.5 * (minus - plus) / denom, 0.0)
+
+    dy = dys[iy] + refine(corr[batch, (py - 1) % shape[0], px], corr[batch, (py + 1) % shape[0], px])
+    dx = dxs[ix] + refine(corr[batch, py, (px - 1) % shape[1]], corr[batch, py, (px + 1) % shape[1]])
+    return np.stack((dy, dx), axis=1), score
+
+def overlap_correlation(a, b, shift):
+    """
+    按整数偏移对齐两个条带，返回重叠部分像素的相关系数（b(p) 对应 a(p + shift)）
+
+    用于核对相位相关找到的峰：真实的重叠接近1，没有重叠时接近0
+    """
+    dy, dx = (int(round(v)) for v in shift)
+    height, width = a.shape
+    b_part = b[max(-dy, 0):height - max(dy, 0), max(-dx, 0):width - max(dx, 0)]
+    a_part = a[max(dy, 0):height + min(dy, 0), max(dx, 0):width + min(dx, 0)]
+    if min(a_part.shape) < 4:
+        return 0.0
+    a_part = a_part - a_part.mean()
+    b_part = b_part - b_part.mean()
+    denom = np.sqrt((a_part * a_part).sum() * (b_part * b_part).sum())
+    return float((a_part * b_part).sum() / denom) if denom > 0 else 0.0
+
+@timed('registration')
+def estimate_positions(paths, max_overlap=MAX_OVERLAP, max_strip=MAX_STRIP,
+                       max_length=MAX_LENGTH, min_correlation=MIN_CORRELATION):
+    """
+    由相邻图片的重叠条带估计四张图片的位置
+
+    每对相邻图片取各自靠近接缝的条带（宽度为边长的 max_overlap，最多
+    max_strip 像素；沿接缝方向只取中间 max_length 像素），按原分辨率用
+    相位相关一次算出同方向两对的偏移。缩小条带会抹掉细小的纹理，
+    因此用截取来限制计算量。找到的偏移再用重叠部分的相关系数核对，
+    相关系数过低（没有重叠或缺少纹理）的一对按名义位置（紧挨着、不重叠）处理
+
+    参数:
+    paths: {象限: 图片路径}
+
+    返回:
+    dict: {"positions": {象限: [x, y]}（LU 在原点，可为小数）,
+           "scores": {"LU-RU": 重叠部分的相关系数, ...}}
+    """
+    sources = {q: QuadrantSource(paths[q]) for q in ("LU", "RU", "LD", "RD")}
+    width, height = sources["LU"].size
+    if any(source.size != (width, height) for source in sources.values()):
+        raise ValueError("四张图片尺寸不一致，无法配准")
+    strip = max(min(int(min(width, height) * max_overlap), max_strip), 8)
+
+    offsets = {}
+    scores = {}
+    for direction in ("h", "v"):
+        pairs = [(a, b) for a, b, d in NEIGHBOURS if d == direction]
+        length = min(height if direction == "h" else width, max_length)
+        if direction == "h":
+            # 左图的右侧条带与右图的左侧条带，转置后第一维垂直于接缝
+            y = (height - length) // 2
+            first = [sources[a].gray_region(width - strip, y, strip, length).T for a, _ in pairs]
+            second = [sources[b].gray_region(0, y, strip, length).T for _, b in pairs]
+        else:
+            x = (width - length) // 2
+            first = [sources[a].gray_region(x, height - strip, length, strip) for a, _ in pairs]
+            second = [sources[b].gray_region(x, 0, length, strip) for _, b in pairs]
+        along = min(strip, length // 4)
+        first = np.stack(first).astype(np.float32)
+        second = np.stack(second).astype(np.float32)
+        shifts, _ = phase_correlation(first, second, ((0, strip), (-along, along)))
+        for (name_a, name_b), a, b, (across, shift) in zip(pairs, first, second, shifts):
+            # across 为垂直于接缝方向的偏移，shift 为沿接缝方向的偏移
+            value = overlap_correlation(a, b, (across, shift))
+            if value < min_correlation:
+                across, shift = strip, 0.0
+            nominal = width if direction == "h" else height
+            offset = (nominal - strip + across, shift)
+            offsets[(name_a, name_b)] = offset if direction == "h" else offset[::-1]
+            scores[f"{name_a}-{name_b}"] = float(value)
+
+    positions = {"LU": np.zeros(2)}
+    positions["RU"] = positions["LU"] + offsets[("LU", "RU")]
+    positions["LD"] = positions["LU"] + offsets[("LU", "LD")]
+    # RD 由两条路径得到，取平均
+    positions["RD"] = (positions["RU"] + offsets[("RU", "RD")]
+                       + positions["LD"] + offsets[("LD", "RD")]) / 2
+    return {"positions": {q: [float(v) for v in p] for q, p in positions.items()},
+            "scores": scores}
+
+def layout(positions, size):
+    """
+    把位置取整并平移到非负坐标
+
+    返回:
+    ({象限: (x, y)}, (合并图宽, 合并图高))
+    """
+    rounded = {q: (int(round(x)), int(round(y))) for q, (x, y) in positions.items()}
+    min_x = min(x for x, _ in rounded.values())
+    min_y = min(y for _, y in rounded.values())
+    placed = {q: (x - min_x, y - min_y) for q, (x, y) in rounded.items()}
+    width = max(x for x, _ in placed.values()) + size[0]
+    height = max(y for _, y in placed.values()) + size[1]
+    return placed, (width, height)
+
+def feather(length, blend):
+    """边缘羽化权重：距边缘 blend 像素内线性增加，其余为1"""
+    distance = np.minimum(np.arange(length), np.arange(length)[::-1]) + 1
+    return np.minimum(distance / max(blend, 1), 1.0).astype(np.float32)
+
+def overlap_regions(placed, size):
+    """
+    两张及以上图片重叠的矩形区域 [(左, 上, 右, 下)]（每对相交的图片一个，可能相互重叠）
+    """
+    regions = []
+    quadrants = list(placed)
+    for i, first in enumerate(quadrants):
+        for second in quadrants[i + 1:]:
+            (x1, y1), (x2, y2) = placed[first], placed[second]
+            left, top = max(x1, x2), max(y1, y2)
+            right, bottom = min(x1, x2) + size[0], min(y1, y2) + size[1]
+            if left < right and top < bottom:
+                regions.append((left, top, right, bottom))
+    return regions
+
+@timed('stitch_registered')
+def stitch_registered(paths, output_path, positions, blend=None, strip_rows=STRIP_ROWS):
+    """
+    按配准位置拼接四张图片并羽化接缝，按行条流式写出
+
+    每张图片的权重为横纵两个方向羽化权重的乘积，重叠处按权重加权平均；
+    只有一张图片覆盖的区域直接复制原像素，只在重叠区域内做浮点加权，
+    因此重叠越窄开销越接近直接拼接
+
+    参数:
+    paths: {象限: 图片路径}
+    output_path: 输出路径
+    positions: estimate_positions 返回的 "positions"
+    blend: 羽化宽度（像素），默认为最大重叠宽度
+    """
+    sources = {q: QuadrantSource(paths[q]) for q in ("LU", "RU", "LD", "RD")}
+    size = sources["LU"].size
+    placed, (width, height) = layout(positions, size)
+    if blend is None:
+        overlaps = [size[0] - (placed["RU"][0] - placed["LU"][0]),
+                    size[0] - (placed["RD"][0] - placed["LD"][0]),
+                    size[1] - (placed["LD"][1] - placed["LU"][1]),
+                    size[1] - (placed["RD"][1] - placed["RU"][1])]
+        blend = max(max(overlaps), 1)
+    weight_x = feather(size[0], blend)
+    weight_y = feather(size[1], blend)
+    regions = overlap_regions(placed, size)
+
+    with BmpWriter(output_path, width, height) as writer:
+        # BMP 自下而上存储，从底部的行条开始
+        for stop in range(height, 0, -strip_rows):
+            start = max(stop - strip_rows, 0)
+            out = np.zeros((stop - start, width, 3), dtype=np.uint8)
+            tiles = {}
+            for quadrant, source in sources.items():
+                x, y = placed[quadrant]
+                top = max(start, y)
+                bottom = min(stop, y + size[1])
+                if top < bottom:
+                    tiles[quadrant] = (top, bottom, source.rows(top - y, bottom - y))
+                    out[top - start:bottom - start, x:x + size[0]] = tiles[quadrant][2]
+
+            for left, top, right, bottom in regions:
+                top, bottom = max(top, start), min(bottom, stop)
+                if top >= bottom:
+                    continue
+                total = np.zeros((bottom - top, right - left, 3), dtype=np.float32)
+                weights = np.zeros((bottom - top, right - left), dtype=np.float32)
+                for quadrant, (tile_top, tile_bottom, pixels) in tiles.items():
+                    x, y = placed[quadrant]
+                    # 该图片与重叠区域的交集（行条内坐标）
+                    r0, r1 = max(top, tile_top), min(bottom, tile_bottom)
+                    c0, c1 = max(left, x), min(right, x + size[0])
+                    if r0 >= r1 or c0 >= c1:
+                        continue
+                    weight = weight_y[r0 - y:r1 - y, None] * weight_x[None, c0 - x:c1 - x]
+                    part = pixels[r0 - tile_top:r1 - tile_top, c0 - x:c1 - x]
+                    total[r0 - top:r1 - top, c0 - left:c1 - left] += part * weight[..., None]
+                    weights[r0 - top:r1 - top, c0 - left:c1 - left] += weight
+                blended = np.divide(total, weights[..., None], out=total,
+                                    where=weights[..., None] > 0)
+                out[top - start:bottom - start, left:right] = np.rint(blended)
+            writer.write_rows(out[::-1])
+
+def setup_key(paths):
+    """扫描仪设置的标识：同一台设备、同样尺寸的图片组使用相同的偏移"""
+    width, height = QuadrantSource(paths["LU"]).size
+    return f"{width}x{height}"
+
+def load_registrations(output_folder):
+    """读取combined文件夹中缓存的配准结果 {设置: 结果}"""
+    try:
+        with open(os.path.join(output_folder, REGISTRATION_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_registration(output_folder, key, registration):
+    """写入一个设置的配准结果（先写临时文件再替换）"""
+    registrations = load_registrations(output_folder)
+    registrations[key] = registration
+    path = os.path.join(output_folder, REGISTRATION_NAME)
+    # 并行合并时多个线程/进程可能同时写入，临时文件各用各的
+    tmp_path = temp_path(path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(registrations, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+def cached_positions(paths, output_folder):
+    """
+    返回该组图片的配准位置：同一设置已有缓存时直接使用，否则由本组估计
+
+    同一批扫描的机械偏移相同，因此整批只需估计一次。只有四对都找到可靠重叠时
+    才缓存（纹理太少的一组不会让后面的组都退回名义位置）；
+    扫描仪重新校准后删除 registration.json 即可重新估计
+    """
+    key = setup_key(paths)
+    registration = load_registrations(output_folder).get(key)
+    if registration is None:
+        registration = estimate_positions(paths)
+        if min(registration["scores"].values()) >= MIN_CORRELATION:
+            save_registration(output_folder, key, registration)
+    return registration["positions"]
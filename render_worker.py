@@ -0,0 +1,130 @@
+import queue
+import threading
+import time
+from collections import deque
+
+class RenderCancelled(Exception):
+    """渲染任务已被更新的请求取代"""
+
+class RenderJob:
+    """
+    传给任务函数的句柄
+
+    任务函数在各阶段之间调用 check()，若已有新的请求则抛出 RenderCancelled；
+    progress() 用于把进度文字送回界面线程
+    """
+
+    def __init__(self, worker, generation):
+        self.worker = worker
+        self.generation = generation
+
+    def cancelled(self):
+        """是否已被新的请求取代"""
+        return self.generation != self.worker.generation
+
+    def check(self):
+        """已被取代时抛出 RenderCancelled"""
+        if self.cancelled():
+            raise RenderCancelled()
+
+    def progress(self, message):
+        """报告进度，由界面线程显示"""
+        if not self.cancelled():
+            self.worker.results.put(('progress', self.generation,
+                                    self.worker.on_progress, message))
+
+class RenderWorker:
+    """
+    后台渲染线程
+
+    - submit 提交的任务会等待 debounce_ms 毫秒，期间到达的新请求会替换旧请求
+    - 新请求会让正在执行的旧任务在下一个检查点取消
+    - supersede 为 False 时改为先进先出：任务依次执行，新请求不替换也不取消
+      之前的任务（合并、导出等不能被丢弃的操作），只有 cancel() 会取消
+    - 结果和进度放入队列，由 Tk 主线程通过 root.after 轮询取出并回调
+    """
+
+    def __init__(self, root, on_progress=None, on_error=None,
+                 debounce_ms=150, poll_ms=50, supersede=True):
+        self.root = root
+        self.on_progress = on_progress
+        self.on_error = on_error
+        self.debounce = debounce_ms / 1000.0
+        self.poll_ms = poll_ms
+        self.supersede = supersede
+        self.generation = 0
+        self.results = queue.Queue()
+        self._pending = deque()
+        self._running = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.root.after(self.poll_ms, self._poll)
+
+    def submit(self, func, callback=None, error_callback=None, debounce=True):
+        """
+        提交任务
+
+        参数:
+        func: 任务函数，接收 RenderJob，返回值传给 callback
+        callback: 完成后在界面线程调用
+        error_callback: 出错时在界面线程调用，默认使用 on_error
+        debounce: 是否等待防抖时间后再执行
+        """
+        with self._condition:
+            if self.supersede:
+                self.generation += 1
+                self._pending.clear()
+            due = time.monotonic() + (self.debounce if debounce else 0)
+            self._pending.append((self.generation, func, callback,
+                                  error_callback or self.on_error, due))
+            self._condition.notify()
+        return self.generation
+
+    def busy(self):
+        """是否有任务在等待或正在执行"""
+        return bool(self._pending) or self._running
+
+    def cancel(self):
+        """取消尚未执行和正在执行的任务"""
+        with self._condition:
+            self.generation += 1
+            self._pending.clear()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # 等待任务到达并且防抖时间已过；supersede 时期间的新请求会替换 _pending
+                while not self._pending or time.monotonic() < self._pending[0][4]:
+                    if not self._pending:
+                        self._condition.wait()
+                    else:
+                        self._condition.wait(self._pending[0][4] - time.monotonic())
+                generation, func, callback, error_callback, _ = self._pending.popleft()
+                self._running = True
+
+            job = RenderJob(self, generation)
+            try:
+                result = func(job)
+            except RenderCancelled:
+                continue
+            except Exception as e:
+                if not job.cancelled():
+                    self.results.put(('error', generation, error_callback, e))
+                continue
+            finally:
+                self._running = False
+            if not job.cancelled():
+                self.results.put(('done', generation, callback, result))
+
+    def _poll(self):
+        """在 Tk 主线程中分发结果"""
+        try:
+            while True:
+                _, generation, callback, value = self.results.get_nowait()
+                # 放入队列后又有新请求（或被取消）的结果直接丢弃
+                if callback is not None and generation == self.generation:
+                    callback(value)
+        except queue.Empty:
+            pass
+        self.root.after(self.poll_ms, self._poll)
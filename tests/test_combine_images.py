@@ -0,0 +1,14 @@
+import os
+from PIL import Image
+import combine_images
+
+def test_main_reports_per_set_results(tmp_path):
+    folder = str(tmp_path)
+    for quadrant in ("LD", "LU", "RD", "RU"):
+        Image.new("RGB", (8, 8)).save(os.path.join(folder, f"A_1_{quadrant}.bmp"))
+    Image.new("RGB", (8, 8)).save(os.path.join(folder, "B_1_LU.bmp"))  # 不完整的一组
+
+    combined, results = combine_images.main(folder, max_workers=2)
+    assert combined == os.path.join(folder, "combined")
+    assert results == {"A_1": True, "B_1": False}
+    assert os.path.exists(os.path.join(combined, "A_1_combined.bmp"))
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from PIL import Image
+from composite import composite_planes, red_green_channels
+from overlay import overlay_images
+from pseudo_color import pseudo_color_image
+
+def write_pseudo(folder, name, mode, seed):
+    """覆盖全部 256 个灰度级的伪彩色图片"""
+    rng = np.random.default_rng(seed)
+    gray = rng.permutation(np.tile(np.arange(256, dtype=np.uint8), 64)).reshape(128, 128)
+    path = str(folder / f"{name}.bmp")
+    pseudo_color_image(gray, mode).save(path)
+    return path
+
+@pytest.mark.parametrize("alpha, threshold", [(0.3, 30), (0.2, 0), (0.45, 60), (0.7, 10)])
+def test_red_green_matches_overlay_images(tmp_path, alpha, threshold):
+    red = write_pseudo(tmp_path, "A_red", 'red', 1)
+    green = write_pseudo(tmp_path, "C_green", 'green', 2)
+    output = overlay_images(red, green, str(tmp_path), alpha=alpha, threshold=threshold,
+                            fmt='png')  # PNG 保留透明通道
+    assert output is not None
+    expected = np.asarray(Image.open(output).convert('RGBA'))
+    result = composite_planes(red_green_channels(red, green, alpha, threshold))
+    assert result.tobytes() == expected.tobytes()
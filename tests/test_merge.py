@@ -0,0 +1,55 @@
+import os
+import numpy as np
+from PIL import Image
+from image_stats import PAIRS_SUFFIX, pair_histogram
+from merge import QUADRANTS, load_manifest, merge_folder
+
+def write_quadrants(folder, prefix, seed):
+    rng = np.random.default_rng(seed)
+    for quadrant in QUADRANTS:
+        gray = rng.integers(0, 256, (32, 32), dtype=np.uint8)
+        Image.fromarray(np.repeat(gray[..., None], 3, axis=2)).save(
+            os.path.join(folder, f"{prefix}_{quadrant}.bmp"))
+
+def test_orphan_cleanup_removes_pair_histograms(tmp_path):
+    folder = str(tmp_path)
+    write_quadrants(folder, "A_1", 0)
+    write_quadrants(folder, "C_1", 1)
+    write_quadrants(folder, "G_1", 2)
+    assert merge_folder(folder, max_workers=1) == {"A_1": True, "C_1": True, "G_1": True}
+    combined = os.path.join(folder, "combined")
+    red, green, other = (os.path.join(combined, f"{p}_combined.bmp")
+                         for p in ("A_1", "C_1", "G_1"))
+    pair_histogram(red, green)
+    pair_histogram(other, red)
+    pair_histogram(other, green)
+
+    for quadrant in QUADRANTS:
+        os.remove(os.path.join(folder, f"A_1_{quadrant}.bmp"))
+    merge_folder(folder, max_workers=1)
+
+    assert not os.path.exists(red)
+    remaining = [f for f in os.listdir(combined) if f.endswith(PAIRS_SUFFIX)]
+    assert remaining == [f"G_1_combined.bmp__C_1_combined.bmp{PAIRS_SUFFIX}"]
+
+def test_incomplete_set_output_removed(tmp_path):
+    folder = str(tmp_path)
+    write_quadrants(folder, "A_1", 0)
+    write_quadrants(folder, "C_1", 1)
+    merge_folder(folder, max_workers=1)
+    combined = os.path.join(folder, "combined")
+    red, green = (os.path.join(combined, f"{p}_combined.bmp") for p in ("A_1", "C_1"))
+    pair_histogram(red, green)
+
+    # 只删掉一个象限：该组不再完整，旧的合并图、组合直方图和清单记录都应删除
+    os.remove(os.path.join(folder, "A_1_RD.bmp"))
+    assert merge_folder(folder, max_workers=1) == {"A_1": False, "C_1": True}
+    assert not os.path.exists(red)
+    assert os.path.exists(green)
+    assert not [f for f in os.listdir(combined) if f.endswith(PAIRS_SUFFIX)]
+    assert "A_1" not in load_manifest(combined)["sets"]
+
+    # 补齐后重新合并
+    write_quadrants(folder, "A_1", 0)
+    assert merge_folder(folder, max_workers=1) == {"A_1": True, "C_1": True}
+    assert os.path.exists(red)
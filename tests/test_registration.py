@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from PIL import Image
+from merge import stitch_in_memory
+from registration import MIN_CORRELATION, estimate_positions, stitch_registered
+
+def spot_scene(height, width, seed=0):
+    """亮背景上散布暗点，与 benchmark 的合成象限相同的纹理"""
+    rng = np.random.default_rng(seed)
+    gray = rng.normal(200, 12, (height, width))
+    spots = rng.random((height, width)) < 0.002
+    gray[spots] = rng.integers(0, 120, spots.sum())
+    return np.clip(gray, 0, 255).astype(np.uint8)
+
+def write_set(folder, size, overlap, drift=3):
+    """从一张大图中裁出四张相互重叠 overlap 像素的象限，RU/RD 另有 drift 像素错位"""
+    scene = spot_scene(2 * size + 2 * drift, 2 * size + 2 * drift)
+    step = size - overlap
+    positions = {"LU": (0, 0), "RU": (step, drift), "LD": (drift, step),
+                 "RD": (step + drift, step + drift)}
+    paths = {}
+    for quadrant, (x, y) in positions.items():
+        gray = scene[y:y + size, x:x + size]
+        paths[quadrant] = str(folder / f"S_{quadrant}.bmp")
+        Image.fromarray(np.repeat(gray[..., None], 3, axis=2)).save(paths[quadrant])
+    return paths, positions
+
+@pytest.mark.parametrize("size, overlap", [(600, 10), (600, 20), (1200, 16)])
+def test_small_overlap_recovered(tmp_path, size, overlap):
+    paths, expected = write_set(tmp_path, size, overlap)
+    registration = estimate_positions(paths)
+    assert min(registration["scores"].values()) >= MIN_CORRELATION
+    for quadrant, (x, y) in expected.items():
+        assert registration["positions"][quadrant] == pytest.approx([x, y], abs=0.5)
+
+def test_nominal_positions_match_plain_stitch(tmp_path):
+    paths, _ = write_set(tmp_path, 256, 0, drift=0)
+    positions = {"LU": [0, 0], "RU": [256, 0], "LD": [0, 256], "RD": [256, 256]}
+    stitch_registered(paths, str(tmp_path / "registered.bmp"), positions)
+    stitch_in_memory(paths, str(tmp_path / "plain.bmp"))
+    assert (tmp_path / "registered.bmp").read_bytes() == (tmp_path / "plain.bmp").read_bytes()
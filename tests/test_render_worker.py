@@ -0,0 +1,73 @@
+import threading
+import time
+from render_worker import RenderWorker
+
+class FakeRoot:
+    """代替 Tk 根窗口：记录 after 回调，由测试调用 pump 分发"""
+
+    def __init__(self):
+        self.callbacks = []
+
+    def after(self, ms, func):
+        self.callbacks.append(func)
+
+    def pump(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for func in callbacks:
+            func()
+
+def wait_idle(root, worker, timeout=5):
+    deadline = time.monotonic() + timeout
+    while (worker.busy() or not worker.results.empty()) and time.monotonic() < deadline:
+        root.pump()
+        time.sleep(0.01)
+    root.pump()
+
+def blocking_task(started, release, log, name):
+    def task(job):
+        started.set()
+        while not release.wait(0.01):
+            job.check()
+        job.check()
+        log.append(name)
+        return name
+    return task
+
+def test_fifo_worker_runs_every_task_in_order():
+    root = FakeRoot()
+    worker = RenderWorker(root, supersede=False)
+    started, release = threading.Event(), threading.Event()
+    log, done = [], []
+    worker.submit(blocking_task(started, release, log, "merge"), done.append, debounce=False)
+    assert started.wait(5)
+    # 合并进行中连续提交两次导出：都不能取消合并，也不能互相替换
+    worker.submit(lambda job: "export1", done.append, debounce=False)
+    worker.submit(lambda job: "export2", done.append, debounce=False)
+    release.set()
+    wait_idle(root, worker)
+    assert log == ["merge"]
+    assert done == ["merge", "export1", "export2"]
+
+def test_fifo_worker_cancel_stops_pending_and_running():
+    root = FakeRoot()
+    worker = RenderWorker(root, supersede=False)
+    started, release = threading.Event(), threading.Event()
+    log, done = [], []
+    worker.submit(blocking_task(started, release, log, "merge"), done.append, debounce=False)
+    worker.submit(lambda job: "export", done.append, debounce=False)
+    assert started.wait(5)
+    worker.cancel()
+    wait_idle(root, worker)
+    assert log == [] and done == []
+
+def test_preview_worker_supersedes():
+    root = FakeRoot()
+    worker = RenderWorker(root)
+    started, release = threading.Event(), threading.Event()
+    log, done = [], []
+    worker.submit(blocking_task(started, release, log, "old"), done.append, debounce=False)
+    assert started.wait(5)
+    worker.submit(lambda job: "new", done.append, debounce=False)
+    release.set()
+    wait_idle(root, worker)
+    assert log == [] and done == ["new"]
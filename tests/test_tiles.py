@@ -0,0 +1,23 @@
+import os
+import numpy as np
+import pytest
+from PIL import Image
+from channel_cache import ChannelCache
+from tiles import TilePyramid
+
+def mapped(path):
+    """当前进程是否映射着该文件（Linux 的 /proc/self/maps）"""
+    with open('/proc/self/maps') as f:
+        return any(line.rstrip().endswith(path) for line in f)
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/maps'), reason="需要 /proc")
+def test_pyramid_does_not_keep_file_mapped(tmp_path):
+    path = str(tmp_path / "A_combined.bmp")
+    gray = np.random.default_rng(0).integers(0, 256, (300, 520), dtype=np.uint8)
+    Image.fromarray(np.repeat(gray[..., None], 3, axis=2)).save(path)
+
+    pyramid = TilePyramid(path, tile_size=128, cache=ChannelCache())
+    assert pyramid.size == (520, 300)
+    assert np.array_equal(pyramid.tile(0, 1, 2), gray[256:300, 128:256])
+    assert pyramid.levels == 4
+    assert not mapped(path)
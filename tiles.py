@@ -0,0 +1,112 @@
+import numpy as np
+from bmp_io import open_bmp
+from channel_cache import default_cache
+from image_stats import pair_histogram
+from instrument import timed
+from overlay import gather_pairs, overlay_table
+from pseudo_color import cached_gray
+
+TILE_SIZE = 256
+
+def reduce_half(plane):
+    """2x2 盒式缩小一半，奇数边先复制最后一行/列，结果尺寸向上取整"""
+    height, width = plane.shape
+    if height % 2 or width % 2:
+        plane = np.pad(plane, ((0, height % 2), (0, width % 2)), mode='edge')
+    total = (plane[0::2, 0::2].astype(np.uint16) + plane[1::2, 0::2]
+             + plane[0::2, 1::2] + plane[1::2, 1::2])
+    return ((total + 2) >> 2).astype(np.uint8)
+
+class TilePyramid:
+    """
+    单张合并图灰度的瓦片金字塔
+
+    第0层为原图，第 k 层缩小 2^k 倍，每层切成 tile_size 见方的瓦片。
+    第0层瓦片直接从映射的BMP中读取对应区域（每次读取临时打开映射、读完即释放，
+    查看期间不占用文件，合并/写出时可以替换它），上层瓦片由下一层的四块瓦片缩小得到；
+    瓦片只在需要时生成并放入共享缓存，因此查看任意局部的开销只与可见瓦片数有关，
+    与图片尺寸无关（缩到整图时才会读遍全图，之后由缓存复用）
+    """
+
+    def __init__(self, image_path, tile_size=TILE_SIZE, cache=default_cache):
+        self.image_path = image_path
+        self.tile_size = tile_size
+        self.cache = cache
+        reader = open_bmp(image_path)
+        self.mappable = reader is not None
+        if self.mappable:
+            self.size = reader.size
+        else:
+            # 压缩等格式无法按区域读取，退回整幅解码（经缓存）
+            height, width = cached_gray(image_path).shape
+            self.size = (width, height)
+        self.levels = 1
+        while max(self.level_size(self.levels - 1)) > tile_size:
+            self.levels += 1
+
+    def level_size(self, level):
+        """第 level 层的 (宽, 高)"""
+        width, height = self.size
+        scale = 1 << level
+        return (width + scale - 1) // scale, (height + scale - 1) // scale
+
+    def tile_count(self, level):
+        """第 level 层的 (列数, 行数)"""
+        width, height = self.level_size(level)
+        return ((width + self.tile_size - 1) // self.tile_size,
+                (height + self.tile_size - 1) // self.tile_size)
+
+    def tile(self, level, col, row):
+        """返回第 level 层 (col, row) 瓦片的灰度（只读 uint8 数组，边缘瓦片较小）"""
+        return self.cache.get_or_create(
+            'tile', [self.image_path], (self.tile_size, level, col, row),
+            lambda: self._make_tile(level, col, row))
+
+    @timed('tile')
+    def _make_tile(self, level, col, row):
+        size = self.tile_size
+        if level == 0:
+            reader = open_bmp(self.image_path) if self.mappable else None
+            if reader is not None:
+                # gray_region 返回副本，reader 释放后映射随之关闭
+                return reader.gray_region(col * size, row * size, size, size)
+            return np.array(cached_gray(self.image_path)[row * size:(row + 1) * size,
+                                                         col * size:(col + 1) * size])
+        # 拼接下一层对应的 2x2 块瓦片再缩小一半
+        cols, rows = self.tile_count(level - 1)
+        parts = [[self.tile(level - 1, c, r) for c in range(2 * col, min(2 * col + 2, cols))]
+                 for r in range(2 * row, min(2 * row + 2, rows))]
+        return reduce_half(np.block(parts))
+
+class OverlayTiles:
+    """
+    按需生成叠加图瓦片
+
+    叠加结果查找表由整幅图片的组合直方图（统计索引）生成，与全图叠加结果一致；
+    每块瓦片只需对两张灰度瓦片做一次组合索引和取值
+    """
+
+    def __init__(self, red_path, green_path, tile_size=TILE_SIZE, cache=default_cache):
+        self.red = TilePyramid(red_path, tile_size, cache)
+        self.green = TilePyramid(green_path, tile_size, cache)
+        if self.red.size != self.green.size:
+            raise ValueError("两张图片尺寸不一致")
+        self.pair_hist = pair_histogram(red_path, green_path)
+        self._tables = {}
+
+    def table(self, params):
+        """按调节参数生成（并记住）组合查找表"""
+        key = tuple(sorted(params.items()))
+        if key not in self._tables:
+            # 只保留最近几组参数，滑块来回调节时不必重算
+            if len(self._tables) >= 8:
+                self._tables.pop(next(iter(self._tables)))
+            self._tables[key] = overlay_table(self.pair_hist, **params)
+        return self._tables[key]
+
+    def tile(self, level, col, row, params):
+        """返回第 level 层 (col, row) 的 RGBA 叠加瓦片（uint8 数组）"""
+        red = self.red.tile(level, col, row)
+        green = self.green.tile(level, col, row)
+        pair_index = red.astype(np.uint16) << 8 | green
+        return gather_pairs(*self.table(params), pair_index)
@@ -0,0 +1,195 @@
+import argparse
+import os
+import threading
+import time
+from bmp_io import bmp_file_complete
+from merge import QUADRANTS, get_prefix, merge_folder
+from output_writer import DEFAULT_FORMAT, FORMATS, OutputWriter, output_name
+from pipeline import render_pair
+from pseudo_color import cached_gray
+
+class FolderWatcher:
+    """
+    监视扫描仪的输出文件夹，一组四张图片写完后立即合并
+
+    扫描仪会在几分钟内陆续写入 _LD/_LU/_RD/_RU 文件。每次 poll 扫描一遍文件夹，
+    文件大小和修改时间在 settle 秒内没有变化、并且长度达到 BMP 文件头中声明的
+    大小时才认为已写完；一组四张都写完后交给 merge_folder 合并，清单照常更新，
+    重新开始监视时不会重复合并。
+    给出 red_type 和 green_type 时，配对的两组（如 A_xxx 与 C_xxx）都合并完成后
+    按 outputs 写出伪彩图和叠加图，文件名与 pipeline 一致
+    """
+
+    def __init__(self, folder_path, red_type=None, green_type=None, outputs=('overlay',),
+                 interval=1.0, settle=2.0, max_workers=None, register=False,
+                 fmt=DEFAULT_FORMAT, **params):
+        self.folder_path = folder_path
+        self.red_type = red_type
+        self.green_type = green_type
+        self.outputs = tuple(kind for kind in outputs if kind in ('pseudo', 'overlay'))
+        self.interval = interval
+        self.settle = settle
+        self.max_workers = max_workers
+        self.register = register
+        self.fmt = fmt
+        self.params = params
+        self._files = {}     # 文件名 -> (大小, 修改时间, 最近一次发生变化的时刻)
+        self._merged = {}    # 前缀 -> 处理时四张源文件的 (大小, 修改时间)
+        self._done = set()   # 合并成功的前缀
+
+    def _scan(self, now):
+        """扫描文件夹，返回已 settle 秒没有变化的文件 {文件名: (大小, 修改时间)}"""
+        current = {}
+        with os.scandir(self.folder_path) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.bmp') or not entry.is_file():
+                    continue
+                st = entry.stat()
+                stat = (st.st_size, st.st_mtime_ns)
+                old = self._files.get(entry.name)
+                changed = old[2] if old is not None and old[:2] == stat else now
+                current[entry.name] = stat + (changed,)
+        self._files = current
+        return {name: value[:2] for name, value in current.items()
+                if now - value[2] >= self.settle}
+
+    def ready_sets(self):
+        """返回四张图片都已写完、且自上次处理后有变化的组 [(前缀, 源文件状态)]"""
+        settled = self._scan(time.monotonic())
+        ready = []
+        for prefix in sorted(set(get_prefix(name) for name in settled)):
+            names = [f"{prefix}_{quadrant}.bmp" for quadrant in QUADRANTS]
+            if not all(name in settled for name in names):
+                continue
+            signature = tuple(settled[name] for name in names)
+            if self._merged.get(prefix) == signature:
+                continue
+            if all(bmp_file_complete(os.path.join(self.folder_path, name)) for name in names):
+                ready.append((prefix, signature))
+        return ready
+
+    def poll(self):
+        """
+        扫描一次并合并新写完的组
+
+        返回:
+        list: 本次合并成功的前缀
+        """
+        ready = self.ready_sets()
+        if not ready:
+            return []
+        results = merge_folder(self.folder_path, self.max_workers,
+                               prefixes=[prefix for prefix, _ in ready],
+                               register=self.register)
+        merged = []
+        for prefix, signature in ready:
+            # 失败的组也记录下来，源文件再次变化前不重复尝试
+            self._merged[prefix] = signature
+            if results.get(prefix):
+                self._done.add(prefix)
+                merged.append(prefix)
+            else:
+                self._done.discard(prefix)
+        if self.outputs and self.red_type and self.green_type:
+            self.render(merged)
+        return merged
+
+    def pairs_for(self, prefixes):
+        """找出包含这些组、且另一组也已合并的 (红色前缀, 绿色前缀)"""
+        pairs = []
+        for prefix in prefixes:
+            head, _, rest = prefix.partition('_')
+            if head == self.red_type:
+                pair = (prefix, f"{self.green_type}_{rest}")
+            elif head == self.green_type:
+                pair = (f"{self.red_type}_{rest}", prefix)
+            else:
+                continue
+            if pair[0] in self._done and pair[1] in self._done and pair not in pairs:
+                pairs.append(pair)
+        return pairs
+
+    def render(self, prefixes):
+        """为新合并的组生成伪彩图和叠加图；结果比合并图新时跳过"""
+        combined_folder = os.path.join(self.folder_path, "combined")
+        # 编码和写文件交给写出线程，写出期间继续计算下一对
+        with OutputWriter() as writer:
+            for red_prefix, green_prefix in self.pairs_for(prefixes):
+                inputs = {prefix: os.path.join(combined_folder, f"{prefix}_combined.bmp")
+                          for prefix in (red_prefix, green_prefix)}
+                red_name = f"{red_prefix}_combined_red"
+                green_name = f"{green_prefix}_combined_green"
+                targets = []
+                if 'pseudo' in self.outputs:
+                    targets += [output_name(red_name, self.fmt), output_name(green_name, self.fmt)]
+                if 'overlay' in self.outputs:
+                    targets.append(output_name(f"{red_name}_{green_name}_overlay", self.fmt))
+                newest = max(os.path.getmtime(path) for path in inputs.values())
+                if all(os.path.exists(os.path.join(combined_folder, name))
+                       and os.path.getmtime(os.path.join(combined_folder, name)) >= newest
+                       for name in targets):
+                    continue
+                # 灰度平面取自刚写出的合并图（经缓存），不再读取四张原始图片
+                grays = {prefix: cached_gray(path) for prefix, path in inputs.items()}
+                render_pair(red_prefix, green_prefix, self.folder_path, combined_folder,
+                            self.outputs, grays=grays, fmt=self.fmt, writer=writer, **self.params)
+
+    def run(self, stop_event=None, on_merged=None):
+        """
+        持续监视，直到 stop_event 被设置
+
+        参数:
+        stop_event: threading.Event，None 表示一直运行（Ctrl+C 结束）
+        on_merged: 每次有组合并成功时以前缀列表调用
+        """
+        if stop_event is None:
+            stop_event = threading.Event()
+        while not stop_event.is_set():
+            merged = self.poll()
+            if merged and on_merged is not None:
+                on_merged(merged)
+            stop_event.wait(self.interval)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="监视文件夹，四张图片写完后立即合并（可同时生成伪彩图和叠加图）")
+    parser.add_argument("folder", help="扫描仪写入 _LD/_LU/_RD/_RU 图片的文件夹")
+    parser.add_argument("--red", default=None, help="红色通道碱基类型，如 A")
+    parser.add_argument("--green", default=None, help="绿色通道碱基类型，如 C")
+    parser.add_argument("--save", default="overlay",
+                        help="配对后需要写出的结果，逗号分隔：pseudo,overlay")
+    parser.add_argument("--interval", type=float, default=1.0, help="扫描间隔（秒）")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="文件多少秒没有变化视为已写完")
+    parser.add_argument("--register", action="store_true",
+                        help="按重叠部分配准四张图片并羽化接缝")
+    parser.add_argument("--format", default=DEFAULT_FORMAT, choices=list(FORMATS),
+                        help="伪彩图和叠加图的输出格式，默认 bmp")
+    parser.add_argument("--alpha", type=float, default=0.3)
+    parser.add_argument("--brightness", type=float, default=0.47)
+    parser.add_argument("--contrast", type=float, default=2.4)
+    parser.add_argument("--saturation", type=float, default=2.33)
+    parser.add_argument("--threshold", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    outputs = tuple(kind.strip() for kind in args.save.split(',') if kind.strip())
+    unknown = [kind for kind in outputs if kind not in ('pseudo', 'overlay')]
+    if unknown:
+        parser.error(f"未知的输出类型: {', '.join(unknown)}")
+    if (args.red is None) != (args.green is None):
+        parser.error("--red 和 --green 需要同时给出")
+
+    watcher = FolderWatcher(
+        args.folder, args.red, args.green, outputs, args.interval, args.settle,
+        register=args.register, fmt=args.format, alpha=args.alpha, brightness=args.brightness, contrast=args.contrast,
+        saturation=args.saturation, threshold=args.threshold)
+    print(f"正在监视: {args.folder}（Ctrl+C 结束）")
+    try:
+        watcher.run(on_merged=lambda merged: print(f"已合并: {', '.join(merged)}"))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import tkinter as tk
+import numpy as np
+from PIL import Image, ImageTk
+from render_worker import RenderWorker
+from tiles import OverlayTiles, TilePyramid
+
+class ZoomViewer:
+    """
+    合并图/叠加图的缩放平移查看窗口
+
+    滚轮以鼠标位置为中心放大或缩小（每级2倍），按住左键拖动平移。
+    只渲染当前层级中可见的瓦片，瓦片在后台线程生成并逐块显示；
+    叠加瓦片使用 params() 返回的当前调节参数。
+    关闭窗口只是隐藏，后台线程在整个程序运行期间复用
+    """
+
+    def __init__(self, root, params=None, title="放大查看"):
+        self.root = root
+        self.params = params or (lambda: {})
+        self.title = title
+        self.window = tk.Toplevel(root)
+        self.window.geometry("900x700")
+        self.window.protocol("WM_DELETE_WINDOW", self.window.withdraw)
+        self.canvas = tk.Canvas(self.window, background='black', highlightthickness=0)
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+        self.status_var = tk.StringVar()
+        tk.Label(self.window, textvariable=self.status_var, anchor=tk.W).pack(fill=tk.X)
+
+        self.source = None      # OverlayTiles 或 TilePyramid
+        self.pyramid = None     # 用于尺寸和层级计算的金字塔
+        self.color_mode = None  # 单张图片时的伪彩模式
+        self.level = 0
+        self.view_x = 0         # 窗口左上角在当前层级中的坐标
+        self.view_y = 0
+        self.version = 0        # 层级或参数变化时递增，旧瓦片直接丢弃
+        self.tiles = {}         # (列, 行) -> (PhotoImage, 画布对象)
+        self._drag = None
+
+        # 瓦片逐块通过进度回调送回界面线程
+        self.worker = RenderWorker(root, on_progress=self._show_tile, debounce_ms=30)
+
+        self.canvas.bind('<Configure>', lambda e: self.request_tiles())
+        self.canvas.bind('<ButtonPress-1>', self._start_drag)
+        self.canvas.bind('<B1-Motion>', self._drag_to)
+        self.canvas.bind('<MouseWheel>', lambda e: self.zoom(e.x, e.y, 1 if e.delta > 0 else -1))
+        self.canvas.bind('<Button-4>', lambda e: self.zoom(e.x, e.y, 1))
+        self.canvas.bind('<Button-5>', lambda e: self.zoom(e.x, e.y, -1))
+
+    def open(self, red_path=None, green_path=None):
+        """
+        显示图片：两张都给出时显示叠加图，只给出一张时显示其伪彩图
+
+        金字塔和统计索引在后台准备（首次打开大图时需要统计组合直方图）
+        """
+        self.window.deiconify()
+        self.window.lift()
+        self.window.title(self.title)
+        self.status_var.set("正在准备...")
+        # 准备期间不再请求旧图片的瓦片，以免取消准备任务
+        self.version += 1
+        self.canvas.delete('tile')
+        self.tiles.clear()
+        self.source = self.pyramid = None
+
+        def prepare(job):
+            if red_path and green_path:
+                source = OverlayTiles(red_path, green_path)
+                return source, source.red, None
+            path, mode = (red_path, 'red') if red_path else (green_path, 'green')
+            pyramid = TilePyramid(path)
+            return pyramid, pyramid, mode
+
+        def on_ready(result):
+            self.source, self.pyramid, self.color_mode = result
+            self.fit()
+
+        self.worker.submit(prepare, on_ready,
+                           lambda e: self.status_var.set(f"打开图片时出错: {e}"),
+                           debounce=False)
+
+    def visible(self):
+        """窗口是否正在显示"""
+        return self.window.winfo_exists() and self.window.state() != 'withdrawn'
+
+    def fit(self):
+        """选择能完整显示整张图片的最精细层级"""
+        width, height = self._canvas_size()
+        self.level = self.pyramid.levels - 1
+        while self.level > 0:
+            level_width, level_height = self.pyramid.level_size(self.level - 1)
+            if level_width > width or level_height > height:
+                break
+            self.level -= 1
+        self.view_x = self.view_y = 0
+        self._reset()
+
+    def refresh(self):
+        """调节参数变化后重新渲染可见瓦片"""
+        if self.source is not None and self.visible():
+            self._reset()
+
+    def zoom(self, x, y, steps):
+        """以窗口坐标 (x, y) 为中心放大（steps>0）或缩小一级"""
+        if self.pyramid is None:
+            return
+        level = min(max(self.level - steps, 0), self.pyramid.levels - 1)
+        if level == self.level:
+            return
+        if level < self.level:
+            self.view_x = (self.view_x + x) * 2 - x
+            self.view_y = (self.view_y + y) * 2 - y
+        else:
+            self.view_x = (self.view_x + x) // 2 - x
+            self.view_y = (self.view_y + y) // 2 - y
+        self.level = level
+        self._reset()
+
+    def _reset(self):
+        """清除当前显示的瓦片并按当前层级重新请求"""
+        self.version += 1
+        self.canvas.delete('tile')
+        self.tiles.clear()
+        self._clamp()
+        self.window.title(f"{self.title} - {100 / (1 << self.level):.1f}%")
+        self.request_tiles()
+
+    def _canvas_size(self):
+        return max(self.canvas.winfo_width(), 1), max(self.canvas.winfo_height(), 1)
+
+    def _clamp(self):
+        """图片比窗口小时居中，否则不允许拖出图片范围"""
+        width, height = self._canvas_size()
+        level_width, level_height = self.pyramid.level_size(self.level)
+        if level_width <= width:
+            self.view_x = (level_width - width) // 2
+        else:
+            self.view_x = min(max(self.view_x, 0), level_width - width)
+        if level_height <= height:
+            self.view_y = (level_height - height) // 2
+        else:
+            self.view_y = min(max(self.view_y, 0), level_height - height)
+
+    def _start_drag(self, event):
+        self._drag = (event.x, event.y)
+
+    def _drag_to(self, event):
+        if self._drag is None or self.pyramid is None:
+            return
+        old_x, old_y = self.view_x, self.view_y
+        self.view_x -= event.x - self._drag[0]
+        self.view_y -= event.y - self._drag[1]
+        self._drag = (event.x, event.y)
+        self._clamp()
+        self.canvas.move('tile', old_x - self.view_x, old_y - self.view_y)
+        self.request_tiles()
+
+    def request_tiles(self):
+        """请求当前窗口内还没有显示的瓦片，并释放已移出窗口的瓦片"""
+        if self.pyramid is None:
+            return
+        size = self.pyramid.tile_size
+        width, height = self._canvas_size()
+        cols, rows = self.pyramid.tile_count(self.level)
+        wanted = [(col, row)
+                  for row in range(max(self.view_y // size, 0),
+                                   min((self.view_y + height - 1) // size + 1, rows))
+                  for col in range(max(self.view_x // size, 0),
+                                   min((self.view_x + width - 1) // size + 1, cols))]
+        for key in [key for key in self.tiles if key not in wanted]:
+            self.canvas.delete(self.tiles.pop(key)[1])
+        missing = [key for key in wanted if key not in self.tiles]
+        self.status_var.set(f"层级 {self.level}/{self.pyramid.levels - 1}，"
+                            f"可见瓦片 {len(wanted)}，待渲染 {len(missing)}")
+        if not missing:
+            return
+
+        source, level, version, mode = self.source, self.level, self.version, self.color_mode
+        params = self.params() if mode is None else None
+
+        def render(job):
+            for col, row in missing:
+                job.check()
+                if mode is None:
+                    image = Image.fromarray(source.tile(level, col, row, params), 'RGBA')
+                else:
+                    gray = source.tile(level, col, row)
+                    rgb = np.zeros(gray.shape + (3,), dtype=np.uint8)
+                    rgb[..., 0 if mode == 'red' else 1] = gray
+                    image = Image.fromarray(rgb, 'RGB')
+                job.progress((version, level, col, row, image))
+
+        self.worker.submit(render, None, lambda e: self.status_var.set(f"渲染瓦片时出错: {e}"))
+
+    def _show_tile(self, value):
+        """在界面线程中显示一块渲染好的瓦片"""
+        version, level, col, row, image = value
+        if version != self.version or (col, row) in self.tiles:
+            return
+        size = self.pyramid.tile_size
+        photo = ImageTk.PhotoImage(image)
+        item = self.canvas.create_image(col * size - self.view_x, row * size - self.view_y,
+                                        anchor=tk.NW, image=photo, tags=('tile',))
+        self.tiles[(col, row)] = (photo, item)